@@ -1,1523 +1,2058 @@
-import asyncio
-import logging
-import sqlite3
-from datetime import datetime, timedelta
-import random
-import string
-from dotenv import load_dotenv, dotenv_values
-from typing import Dict, Any, Callable, Awaitable, Union
-import os
-from aiogram import Bot, Dispatcher, Router, BaseMiddleware, F
-from aiogram.filters import Command
-from aiogram.fsm.context import FSMContext
-from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import (Message, CallbackQuery, ReplyKeyboardMarkup,
-                           KeyboardButton, InlineKeyboardMarkup,
-                           InlineKeyboardButton, ReplyKeyboardRemove)
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from environs import Env
-from dataclasses import dataclass
-from gradio_client import Client
-
-load_dotenv()
-
-
-# Конфигурация
-
-@dataclass
-class Config:
-    token: str
-    admin_ids: list[int]
-    openai_api_key: str
-    qwen_url: str
-
-
-def load_config() -> Config:
-    return Config(
-        token=os.getenv("BOT_TOKEN"),
-        admin_ids=list(map(int, os.getenv("ADMIN_IDS").split(','))),
-        openai_api_key=os.getenv("OPENAI_API_KEY"),
-        qwen_url=os.getenv("QWEN_URL", "Qwen/Qwen2.5")  # Добавляем URL по умолчанию
-    )
-
-
-# База данных
-class Database:
-
-    def __init__(self, db_file: str):
-        self.connection = sqlite3.connect(db_file)
-        self.cursor = self.connection.cursor()
-        self._create_tables()
-
-    def _create_tables(self):
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS projects (
-                id INTEGER PRIMARY KEY,
-                name TEXT NOT NULL,
-                code TEXT UNIQUE NOT NULL,
-                manager_id INTEGER NOT NULL
-            )
-        ''')
-        self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY,
-                    telegram_id INTEGER NOT NULL,
-                    name TEXT NOT NULL,
-                    role TEXT,
-                    project_id INTEGER,
-                    is_active INTEGER DEFAULT 0,
-                    FOREIGN KEY (project_id) REFERENCES projects (id)
-                )
-            ''')
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY,
-                telegram_id INTEGER UNIQUE NOT NULL,
-                name TEXT NOT NULL,
-                role TEXT,
-                project_id INTEGER,
-                FOREIGN KEY (project_id) REFERENCES projects (id)
-            )
-        ''')
-
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS project_roles (
-                id INTEGER PRIMARY KEY,
-                project_id INTEGER NOT NULL,
-                role_name TEXT NOT NULL,
-                FOREIGN KEY (project_id) REFERENCES projects (id),
-                UNIQUE(project_id, role_name)
-            )
-        ''')
-        
-
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tasks (
-                id INTEGER PRIMARY KEY,
-                project_id INTEGER NOT NULL,
-                description TEXT NOT NULL,
-                deadline DATETIME NOT NULL,
-                assigned_to INTEGER,
-                status TEXT DEFAULT 'pending',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (project_id) REFERENCES projects (id),
-                FOREIGN KEY (assigned_to) REFERENCES users (id)
-            )
-        ''')
-
-
-        
-
-        
-
-        self.connection.commit()
-
-    def add_project(self, name: str, code: str, manager_id: int) -> int:
-        self.cursor.execute(
-            'INSERT INTO projects (name, code, manager_id) VALUES (?, ?, ?)',
-            (name, code, manager_id))
-        self.connection.commit()
-        return self.cursor.lastrowid
-
-    def get_active_project(self, telegram_id: int) -> tuple:
-        """Get user's currently active project"""
-        self.cursor.execute('''
-            SELECT p.* FROM projects p
-            JOIN users u ON p.id = u.project_id
-            WHERE u.telegram_id = ? AND u.is_active = 1
-        ''', (telegram_id,))
-        return self.cursor.fetchone()
-    
-    def get_active_user(self, telegram_id: int) -> tuple:
-        """Get user's currently active project"""
-        self.cursor.execute('''
-            SELECT id FROM users
-            WHERE telegram_id = ? AND is_active = 1
-        ''', (telegram_id,))
-        return self.cursor.fetchone()
-    
-    def get_active_role(self, telegram_id: int) -> tuple:
-        """Get user's currently active project"""
-        self.cursor.execute('''
-            SELECT role FROM users
-            WHERE telegram_id = ? AND is_active = 1
-        ''', (telegram_id,))
-        return self.cursor.fetchone()
-
-    def add_user(self, telegram_id: int, name: str, project_id: int = None, role: str = None) -> int:
-        """Add user to a project. If user exists in other projects, add new project entry."""
-        try:
-            # First check if user exists in this specific project
-            self.cursor.execute(
-                'SELECT id FROM users WHERE telegram_id = ? AND project_id = ?',
-                (telegram_id, project_id)
-            )
-            existing_user = self.cursor.fetchone()
-
-            if existing_user:
-                # User already exists in this project, return existing ID
-                return existing_user[0]
-
-            # Add new user entry for this project
-            self.cursor.execute(
-                'INSERT INTO users (telegram_id, name, project_id, role) VALUES (?, ?, ?, ?)',
-                (telegram_id, name, project_id, role)
-            )
-            self.connection.commit()
-            return self.cursor.lastrowid
-
-        except sqlite3.Error as e:
-            logging.error(f"Error in add_user: {e}")
-            raise
-
-    def add_task(self,
-                 project_id: int,
-                 description: str,
-                 deadline: datetime,
-                 assigned_to: int = None) -> int:
-        self.cursor.execute(
-            'INSERT INTO tasks (project_id, description, deadline, assigned_to) VALUES (?, ?, ?, ?)',
-            (project_id, description, deadline, assigned_to))
-        self.connection.commit()
-        return self.cursor.lastrowid
-
-    def get_user(self, telegram_id: int):
-        self.cursor.execute('SELECT * FROM users WHERE telegram_id = ?',
-                            (telegram_id, ))
-        return self.cursor.fetchone()
-
-    def get_project(self, code: str):
-        self.cursor.execute('SELECT * FROM projects WHERE code = ?', (code, ))
-        return self.cursor.fetchone()
-
-    def get_project_by_id(self, project_id: int):
-        if project_id is None:
-            return None
-        self.cursor.execute('SELECT * FROM projects WHERE id = ?', (project_id,))
-        return self.cursor.fetchone()
-    def get_user_by_id(self, user_id: int):
-        self.cursor.execute('SELECT * FROM users WHERE id = ?', (user_id, ))
-        return self.cursor.fetchone()
-
-    def get_task_by_id(self, task_id: int):
-        self.cursor.execute('SELECT * FROM tasks WHERE id = ?', (task_id, ))
-        return self.cursor.fetchone()
-
-    def get_tasks_by_user(self, user_id: int):
-        self.cursor.execute(
-            '''
-            SELECT * FROM tasks 
-            WHERE assigned_to = ? AND status != 'completed'
-            ORDER BY deadline
-        ''', (user_id, ))
-        return self.cursor.fetchall()
-
-    def get_project_users(self, project_id: int):
-        self.cursor.execute('SELECT * FROM users WHERE project_id = ?',
-                            (project_id, ))
-        return self.cursor.fetchall()
-
-    def update_task_status(self, task_id: int, status: str):
-        self.cursor.execute('UPDATE tasks SET status = ? WHERE id = ?',
-                            (status, task_id))
-        self.connection.commit()
-
-    def update_user_role(self, user_id: int, role: str):
-        self.cursor.execute('UPDATE users SET role = ? WHERE id = ?',
-                            (role, user_id))
-        self.connection.commit()
-
-
-    def add_project_role(self, project_id: int, role_name: str):
-        try:
-            self.cursor.execute(
-                'INSERT INTO project_roles (project_id, role_name) VALUES (?, ?)',
-                (project_id, role_name)
-            )
-            self.connection.commit()
-        except sqlite3.IntegrityError:
-            pass  # Игнорируем дубликаты ролей
-
-    def get_project_roles(self, project_id: int) -> list:
-        self.cursor.execute(
-            'SELECT role_name FROM project_roles WHERE project_id = ?',
-            (project_id,)
-        )
-        return [role[0] for role in self.cursor.fetchall()]
-
-    def get_user_active_project(self, telegram_id: int) -> tuple:
-        """Get user's currently active project along with their role"""
-        self.cursor.execute('''
-            SELECT p.*, u.role, u.id as user_id
-            FROM projects p
-            JOIN users u ON p.id = u.project_id
-            WHERE u.telegram_id = ? AND u.is_active = 1
-        ''', (telegram_id,))
-        return self.cursor.fetchone()
-    
-    def get_project_participants(self, project_id: int) -> list:
-        """Get all participants of a project with their roles"""
-        self.cursor.execute('''
-            SELECT u.name, u.role, u.telegram_id
-            FROM users u
-            WHERE u.project_id = ?
-            ORDER BY u.role, u.name
-        ''', (project_id,))
-        return self.cursor.fetchall()
-
-    # Add to the Database class
-    def get_user_projects(self, telegram_id: int) -> list:
-        """Get all projects where user is a member"""
-        self.cursor.execute('''
-            SELECT DISTINCT p.* 
-            FROM projects p
-            JOIN users u ON p.id = u.project_id
-            WHERE u.telegram_id = ?
-        ''', (telegram_id,))
-        return self.cursor.fetchall()
-
-    # Изменить метод в классе Database
-    def switch_user_project(self, telegram_id: int, project_id: int) -> bool:
-        """Switch user's active project"""
-        try:
-            # First verify the project exists
-            project = self.get_project_by_id(project_id)
-            if not project:
-                return False
-
-            # Update last_active status for all user's projects
-            self.cursor.execute('''
-                UPDATE users 
-                SET is_active = 0 
-                WHERE telegram_id = ?
-            ''', (telegram_id,))
-
-            # Set the selected project as active
-            self.cursor.execute('''
-                UPDATE users 
-                SET is_active = 1 
-                WHERE telegram_id = ? AND project_id = ?
-            ''', (telegram_id, project_id))
-
-            self.connection.commit()
-            return True
-        except Exception as e:
-            logging.error(f"Error in switch_user_project: {e}")
-            return False
-
-    def delete_project(self, project_id: int) -> bool:
-        """Delete project and all related data"""
-        try:
-            self.cursor.execute('DELETE FROM tasks WHERE project_id = ?', (project_id,))
-            self.cursor.execute('DELETE FROM project_roles WHERE project_id = ?', (project_id,))
-            self.cursor.execute('DELETE FROM users WHERE project_id = ?', (project_id,))
-            self.cursor.execute('DELETE FROM projects WHERE id = ?', (project_id,))
-            self.connection.commit()
-            return True
-        except Exception:
-            return False
-        
-
-    def add_feedback(self, task_id: int, feedback: str, rating: int):
-        """Add feedback for completed task"""
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS task_feedback (
-                id INTEGER PRIMARY KEY,
-                task_id INTEGER NOT NULL,
-                feedback TEXT NOT NULL,
-                rating INTEGER NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (task_id) REFERENCES tasks (id)
-            )
-        ''')
-        
-        self.cursor.execute(
-            'INSERT INTO task_feedback (task_id, feedback, rating) VALUES (?, ?, ?)',
-            (task_id, feedback, rating)
-        )
-        self.connection.commit() 
-
-    def add_bot_feedback(self, user_id: int, feedback: str):
-        """Add feedback about bot"""
-        self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS bot_feedback (
-                id INTEGER PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                feedback TEXT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        self.cursor.execute(
-            'INSERT INTO bot_feedback (user_id, feedback) VALUES (?, ?)',
-            (user_id, feedback)
-        )
-        self.connection.commit()    
-        
-
-# Состояния FSM
-class RegistrationStates(StatesGroup):
-    waiting_for_name = State()
-    waiting_for_project_code = State()
-    waiting_for_role = State()
-
-
-class ProjectCreationStates(StatesGroup):
-    waiting_for_name = State()
-    waiting_for_roles = State()
-
-class TaskCreationStates(StatesGroup):
-    waiting_for_description = State()
-    waiting_for_deadline = State()
-    waiting_for_assignee = State()
-
-# Add to the States section
-class ProjectManagementStates(StatesGroup):
-    waiting_for_new_project_code = State()
-    confirm_project_deletion = State()
-
-
-# Клавиатуры
-def get_home_button() -> ReplyKeyboardMarkup:
-    return ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text="На главную")]],
-        resize_keyboard=True,
-        persistent=True  # Кнопка будет постоянно видна
-    )
-
-def get_role_keyboard() -> ReplyKeyboardMarkup:
-    buttons = [[KeyboardButton(text="Программист")],
-               [KeyboardButton(text="Дизайнер")],
-               [KeyboardButton(text="Аналитик")]]
-    return ReplyKeyboardMarkup(keyboard=buttons,
-                               resize_keyboard=True,
-                               one_time_keyboard=True) 
-
-
-def get_main_keyboard(is_manager: bool = False) -> InlineKeyboardMarkup:
-    buttons = [[
-        InlineKeyboardButton(text="📋 Мои задачи", callback_data="show_tasks")
-    ],
-    [
-        InlineKeyboardButton(text="🔄 Сменить проект", callback_data="switch_project")
-    ],
-    [
-        InlineKeyboardButton(text="➕ Присоединиться к проекту", callback_data="join_project")
-    ],
-    [
-        InlineKeyboardButton(text="📝 Создать новый проект", callback_data="create_new_project")
-    ],
-    [
-        InlineKeyboardButton(text="📢 Оставить отзыв о боте", callback_data="bot_feedback")
-    ]]
-    
-    if is_manager:
-        buttons.extend([
-            [InlineKeyboardButton(text="✏️ Создать задачу", callback_data="create_task")],
-            [InlineKeyboardButton(text="📊 Отчет по проекту", callback_data="project_report")],
-            [InlineKeyboardButton(text="👥 Участники проекта", callback_data="view_participants")],
-            [InlineKeyboardButton(text="🔑 Узнать код проекта", callback_data="get_project_code")],
-            [InlineKeyboardButton(text="❌ Удалить проект", callback_data="delete_project")]
-        ])
-    return InlineKeyboardMarkup(inline_keyboard=buttons)
-
-
-
-
-def get_project_code_keyboard(project_code: str) -> InlineKeyboardMarkup:
-    buttons = [[
-        InlineKeyboardButton(text="🔙 Вернуться", callback_data="back_to_main")
-    ]]
-    return InlineKeyboardMarkup(inline_keyboard=buttons)
-
-
-def get_task_inline_keyboard(task_id: int) -> InlineKeyboardMarkup:
-    buttons = [
-        [
-            InlineKeyboardButton(
-                text="✅ Отметить выполненной",
-                callback_data=f"complete_task_{task_id}"
-            )
-        ],
-        [
-            InlineKeyboardButton(
-                text="📋 Детали",
-                callback_data=f"task_details_{task_id}"
-            )
-        ],
-        [
-            InlineKeyboardButton(
-                text="⭐ Оставить отзыв",
-                callback_data=f"leave_feedback_{task_id}"
-            )
-        ]
-    ]
-    return InlineKeyboardMarkup(inline_keyboard=buttons)
-
-
-# Middleware
-class UserCheckMiddleware(BaseMiddleware):
-    def __init__(self, database: Database):
-        self.database = database
-        super().__init__()
-
-    async def __call__(
-        self, 
-        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
-        event: Message,
-        data: Dict[str, Any]
-    ) -> Any:
-        if not isinstance(event, Message):
-            return await handler(event, data)
-
-        # Get the current state from FSMContext
-        state: FSMContext = data.get("state")
-        if state:
-            current_state = await state.get_state()
-        else:
-            current_state = None
-
-        user = self.database.get_user(event.from_user.id)
-
-        # Allow messages if:
-        # 1. It's the /start command
-        # 2. User exists
-        # 3. User is in registration state
-        # 4. User is in project creation state
-        if (
-            event.text == "/start" 
-            or user is not None 
-            or (current_state and current_state.startswith("RegistrationStates:"))
-            or (current_state and current_state.startswith("ProjectCreationStates:"))
-        ):
-            data["user"] = user
-            data["db"] = self.database
-            return await handler(event, data)
-
-        await event.answer(
-            "Пожалуйста, сначала зарегистрируйтесь с помощью команды /start"
-        )
-        return
-
-
-class CallbackMiddleware(BaseMiddleware):
-    def __init__(self, database: Database):
-        self.database = database
-        super().__init__()
-
-    async def __call__(
-        self,
-        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
-        event: CallbackQuery,
-        data: Dict[str, Any]
-    ) -> Any:
-        # Get the current state from FSMContext
-        state: FSMContext = data.get("state")
-        if state:
-            current_state = await state.get_state()
-        else:
-            current_state = None
-
-        user = self.database.get_user(event.from_user.id)
-
-        # Allow callbacks if:
-        # 1. User exists
-        # 2. User is in registration state
-        # 3. User is in project creation state
-        if (
-            user is not None 
-            or (current_state and current_state.startswith("RegistrationStates:"))
-            or (current_state and current_state.startswith("ProjectCreationStates:"))
-        ):
-            data["user"] = user
-            data["db"] = self.database
-            return await handler(event, data)
-
-        await event.answer(
-            "Пожалуйста, сначала зарегистрируйтесь с помощью команды /start",
-            show_alert=True
-        )
-        return
-
-
-# Утилиты
-def generate_project_code() -> str:
-    """Генерирует уникальный код проекта"""
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-
-
-def format_task_info(task: tuple) -> str:
-    """Форматирует информацию о задаче для вывода"""
-    task_id, project_id, description, deadline, assigned_to, status, created_at = task
-    deadline_dt = datetime.strptime(deadline, '%Y-%m-%d %H:%M:%S')
-    return (f"Задача #{task_id}\n"
-            f"Описание: {description}\n"
-            f"Дедлайн: {deadline_dt.strftime('%d.%m.%Y %H:%M')}\n"
-            f"Статус: {status}")
-
-
-async def get_best_assignee(description: str, project_roles: list, db: Database, project_id: int) -> int:
-    try:
-        # Инициализируем клиент Qwen
-        client = Client("Qwen/Qwen2.5")
-
-        # Формируем prompt для модели
-        prompt = f"""Проанализируйте это описание задачи и определите, какая роль лучше всего подходит для ее выполнения.
-Описание задачи: {description}
-Роли: {', '.join(project_roles)}
-
-Учесть следующее:
-1. Технические требования
-2. Необходимые навыки
-3. Тип выполняемой работы
-
-Укажите в ответ только одно название роли из списка доступных ролей, которое наилучшим образом соответствует данной задаче."""
-
-        # Получаем ответ от модели
-        result = client.predict(
-            query=prompt,
-            history=[],
-            system="Вы являетесь ассистентом по управлению проектами. Ваша задача - проанализировать задачи проекта и определить наиболее подходящую роль для выполнения.",
-            radio="72B",
-            api_name="/model_chat"
-        )
-
-        # Получаем рекомендованную роль из ответа
-        recommended_role = result[1][0][1]['text'].strip()
-
-        # Находим пользователя с этой ролью в проекте
-        cursor = db.cursor.execute(
-            '''
-            SELECT id FROM users 
-            WHERE project_id = ? AND role = ?
-            ORDER BY RANDOM() LIMIT 1
-            ''', (project_id, recommended_role)
-        )
-        user = cursor.fetchone()
-
-        if user:
-            return user[0]
-        else:
-            # Если не нашли пользователя с рекомендованной ролью,
-            # выбираем случайного пользователя из проекта
-            cursor = db.cursor.execute(
-                'SELECT id FROM users WHERE project_id = ? ORDER BY RANDOM() LIMIT 1',
-                (project_id,)
-            )
-            user = cursor.fetchone()
-            return user[0] if user else None
-
-    except Exception as e:
-        logging.error(f"Error in get_best_assignee: {e}")
-        return None
-
-
-
-# Обработчики
-router = Router()
-
-
-@router.message(Command("start"))
-async def cmd_start(message: Message, state: FSMContext, db: Database):
-    user = db.get_user(message.from_user.id)
-    if user:
-        is_manager = db.get_project_by_id(user[4])[3] == message.from_user.id
-        await message.answer("С возвращением! Выберите действие:",
-                             reply_markup=get_main_keyboard(is_manager))
-        return
-
-    await state.set_state(RegistrationStates.waiting_for_name)
-    await message.answer("Добро пожаловать! Пожалуйста, введите ваше имя:")
-
-
-@router.message(F.text == "На главную")
-async def handle_home_button(message: Message, state: FSMContext, db: Database):
-    user = db.get_user(message.from_user.id)
-    if user:
-        is_manager = db.get_project_by_id(user[4])[3] == message.from_user.id
-        await message.answer("С возвращением! Выберите действие:",
-                             reply_markup=get_main_keyboard(is_manager))
-        return
-    
-    await state.set_state(RegistrationStates.waiting_for_name)
-    await message.answer("Добро пожаловать! Пожалуйста, введите ваше имя:")
-
-
-@router.callback_query(F.data.startswith("task_details_"))
-async def cb_task_details(callback: CallbackQuery, db: Database):
-    task_id = int(callback.data.split("_")[-1])
-    task = db.get_task_by_id(task_id)  # Добавьте этот метод в класс Database
-    if not task:
-        await callback.answer("Задача не найдена", show_alert=True)
-        return
-
-    project = db.get_project_by_id(task[1])
-    assignee = db.get_user_by_id(task[4])
-
-    details = (
-        f"🔍 Подробная информация о задаче #{task[0]}\n\n"
-        f"📝 Описание: {task[2]}\n"
-        f"⏰ Дедлайн: {datetime.strptime(task[3], '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y %H:%M')}\n"
-        f"📋 Проект: {project[1]}\n"
-        f"👤 Исполнитель: {assignee[2]} ({assignee[3]})\n"
-        f"📊 Статус: {task[5]}\n"
-        f"📅 Создано: {datetime.strptime(task[6], '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y %H:%M')}"
-    )
-
-    await callback.message.edit_text(
-        details, reply_markup=get_task_inline_keyboard(task_id))
-    await callback.answer()
-
-
-@router.message(RegistrationStates.waiting_for_name)
-async def process_name(message: Message, state: FSMContext):
-    await state.update_data(name=message.text)
-    await state.set_state(RegistrationStates.waiting_for_project_code)
-    await message.answer(
-        "Введите код проекта или /create для создания нового проекта:")
-
-
-@router.message(Command("create"))
-@router.callback_query(F.data == "create_new_project")
-async def cmd_create_project(event: Union[Message, CallbackQuery], state: FSMContext):
-    await state.set_state(ProjectCreationStates.waiting_for_name)
-    if isinstance(event, CallbackQuery):
-        await event.message.edit_text("Введите название нового проекта:")
-    else:
-        await event.answer("Введите название нового проекта:")
-
-
-@router.message(ProjectCreationStates.waiting_for_name)
-async def process_project_name(message: Message, state: FSMContext, db: Database):
-    project_name = message.text
-    project_code = generate_project_code()
-
-    # Сохраняем данные проекта в state
-    await state.update_data(
-        project_name=project_name,
-        project_code=project_code
-    )
-
-    await state.set_state(ProjectCreationStates.waiting_for_roles)
-    await message.answer(
-        "Введите роли для вашего проекта через запятую.\n"
-        "Например: Программист, Дизайнер, Аналитик, Тестировщик"
-    )
-
-@router.message(ProjectCreationStates.waiting_for_roles)
-async def process_project_roles(message: Message, state: FSMContext, db: Database):
-    # Получаем роли из сообщения
-    roles = [role.strip() for role in message.text.split(',')]
-
-    # Получаем сохраненные данные проекта
-    data = await state.get_data()
-    project_name = data['project_name']
-    project_code = data['project_code']
-
-    # Создаем проект
-    project_id = db.add_project(project_name, project_code, message.from_user.id)
-
-    # Добавляем роли проекта
-    for role in roles:
-        db.add_project_role(project_id, role)
-
-    try:
-        # Добавляем пользователя как менеджера проекта
-        db.add_user(message.from_user.id, message.from_user.full_name, project_id, "Manager")
-    except sqlite3.IntegrityError:
-        # Игнорируем ошибку уникального ключа, так как пользователь уже существует
-        pass
-
-    await state.clear()    
-    
-    await message.answer(
-        "Для быстрого возврата в главное меню используйте кнопку ниже",
-        reply_markup=get_home_button()
-    )
-    await message.answer(
-        f"Проект '{project_name}' успешно создан!\n"
-        f"Ваша роль: Manager\n"
-        f"Доступные роли в проекте: {', '.join(roles)}\n\n"
-        f"Код проекта: `{project_code}`\n\n"
-        "Поделитесь этим кодом с участниками команды.",
-        reply_markup=get_main_keyboard(True),
-        parse_mode="Markdown"
-    )
-
-
-
-
-@router.message(RegistrationStates.waiting_for_project_code)
-async def process_project_code(message: Message, state: FSMContext, db: Database):
-    if message.text == "/create":
-        await state.set_state(ProjectCreationStates.waiting_for_name)
-        await message.answer("Введите название нового проекта:")
-        return
-
-    project = db.get_project(message.text)
-    if not project:
-        await message.answer(
-            "Проект не найден. Попробуйте еще раз или используйте /create для создания нового проекта."
-        )
-        return
-
-    # Получаем роли проекта
-    project_roles = db.get_project_roles(project[0])
-
-    if not project_roles:
-        await message.answer(
-            "В проекте не определены роли. Обратитесь к менеджеру проекта."
-        )
-        return
-
-    # Сохраняем данные проекта
-    await state.update_data(project_id=project[0])
-
-    # Создаем клавиатуру с ролями
-    buttons = [[InlineKeyboardButton(text=role, callback_data=f"set_role_{role}")] 
-               for role in project_roles]
-
-    await state.set_state(RegistrationStates.waiting_for_role)
-    await message.answer(
-        "Выберите вашу роль в проекте:",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons)
-    )
-
-@router.callback_query(F.data.startswith("set_role_"))
-async def process_role_selection(callback: CallbackQuery, state: FSMContext, db: Database):
-    selected_role = callback.data.split("set_role_")[1]
-    user_data = await state.get_data()
-
-    # Проверяем, не зарегистрирован ли уже пользователь
-    existing_user = db.get_user(callback.from_user.id)
-    if existing_user:
-        await callback.message.edit_text(
-            "Вы уже зарегистрированы в проекте.",
-            reply_markup=get_main_keyboard(existing_user[3] == "Manager")
-        )
-        return
-
-    # Добавляем пользователя
-    db.add_user(
-        callback.from_user.id,
-        callback.from_user.full_name,  # Используем полное имя из Telegram
-        user_data["project_id"],
-        selected_role
-    )
-
-    await state.clear()
-    await callback.message.edit_text(
-        f"Регистрация успешно завершена!\n"
-        f"Ваша роль: {selected_role}"
-    )
-
-    await callback.message.answer(
-        "Выберите действие:",
-        reply_markup=get_main_keyboard(False)
-    )
-
-
-
-@router.message(RegistrationStates.waiting_for_role)
-async def process_role(message: Message, state: FSMContext, db: Database):
-    valid_roles = ["Программист", "Дизайнер", "Аналитик"]
-    if message.text not in valid_roles:
-        await message.answer(
-            "Пожалуйста, выберите одну из доступных ролей, используя кнопки ниже:",
-            reply_markup=get_role_keyboard())
-        return
-
-    user_data = await state.get_data()
-    db.add_user(message.from_user.id, user_data["name"],
-                user_data["project_id"], message.text)
-
-    await state.clear()
-    await message.answer(
-        "Регистрация завершена! Теперь вы можете получать и управлять задачами.",
-        reply_markup=get_main_keyboard(False))
-
-
-@router.callback_query(F.data == "create_task")
-async def cb_create_task(callback: CallbackQuery, state: FSMContext,
-                         db: Database, user: tuple):
-    project = db.get_project_by_id(user[4])
-    if project[3] != callback.from_user.id:
-        await callback.answer(
-            "Только руководитель проекта может создавать задачи.",
-            show_alert=True)
-        return
-
-    await callback.message.delete()  # Удаляем предыдущее сообщение
-    await state.set_state(TaskCreationStates.waiting_for_description)
-    await callback.message.answer("Опишите задачу:")
-    await callback.answer()
-
-
-@router.message(TaskCreationStates.waiting_for_description)
-async def process_task_description(message: Message, state: FSMContext):
-    # Сохраняем описание задачи
-    await state.update_data(description=message.text)
-
-    # Отправляем подтверждение и запрос дедлайна
-    await message.answer(f"✅ Описание задачи получено:\n{message.text}\n\n"
-                         "Теперь укажите дедлайн в формате ДД.ММ.ГГГГ ЧЧ:ММ\n"
-                         "Например: 31.12.2024 15:00")
-
-    # Переходим к следующему состоянию
-    await state.set_state(TaskCreationStates.waiting_for_deadline)
-
-
-@router.callback_query(F.data.startswith("assign_task_"))
-async def cb_assign_task(callback: CallbackQuery, state: FSMContext,
-                         db: Database):
-    assignee_id = int(callback.data.split("_")[-1])
-    task_data = await state.get_data()
-
-    task_id = db.add_task(task_data.get("project_id"),
-                          task_data["description"], task_data["deadline"],
-                          assignee_id)
-
-    assignee = db.get_user_by_id(
-        assignee_id)  # Добавьте этот метод в класс Database
-
-    await state.clear()
-    await callback.message.edit_text(
-        f"Задача создана и назначена на {assignee[2]}!",
-        reply_markup=get_main_keyboard(True))
-    await callback.answer()
-
-
-@router.message(TaskCreationStates.waiting_for_deadline)
-async def process_task_deadline(message: Message, state: FSMContext, db: Database, user: tuple, bot: Bot):
-    try:
-        deadline = datetime.strptime(message.text, '%d.%m.%Y %H:%M')
-    except ValueError:
-        await message.answer(
-            "Неверный формат даты. Попробуйте еще раз в формате ДД.ММ.ГГГГ ЧЧ:ММ"
-        )
-        return
-
-    task_data = await state.get_data()
-    project_id = user[4]
-
-    # Получаем доступные роли проекта
-    project_roles = db.get_project_roles(project_id)
-
-    # Получаем рекомендованного исполнителя
-    best_assignee = await get_best_assignee(
-        task_data["description"],
-        project_roles,
-        db,
-        project_id
-    )
-
-    if best_assignee:
-        # Создаем задачу с автоматически выбранным исполнителем
-        task_id = db.add_task(
-            project_id,
-            task_data["description"],
-            deadline,
-            best_assignee
-        )
-
-        # Получаем информацию о выбранном исполнителе
-        assignee = db.get_user_by_id(best_assignee)
-
-        await bot.send_message(
-            assignee[1],  # telegram_id
-            f"📢 Вам назначена новая задача!\n\n"
-            f"Описание: {task_data['description']}\n"
-            f"Дедлайн: {deadline.strftime('%d.%m.%Y %H:%M')}\n\n"
-            f"Используйте меню 'Мои задачи' для просмотра деталей.",
-            reply_markup=get_task_inline_keyboard(task_id)
-        )
-
-
-        await state.clear()
-        await message.answer(
-            f"✅ Задача автоматически назначена на {assignee[2]} ({assignee[3]})!\n"
-            f"Описание: {task_data['description']}\n"
-            f"Дедлайн: {deadline.strftime('%d.%m.%Y %H:%M')}",
-            reply_markup=get_main_keyboard(True)
-        )
-    else:
-        # Если не удалось автоматически назначить, показываем список исполнителей
-        project_users = db.get_project_users(project_id)
-        user_buttons = []
-
-        for proj_user in project_users:
-            user_buttons.append([
-                InlineKeyboardButton(
-                    text=f"{proj_user[2]} ({proj_user[3]})",
-                    callback_data=f"assign_task_{proj_user[0]}"
-                )
-            ])
-
-        await message.answer(
-            "Не удалось автоматически назначить исполнителя. Выберите исполнителя вручную:",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=user_buttons)
-        )
-
-        await state.set_state(TaskCreationStates.waiting_for_assignee)
-
-
-@router.message(TaskCreationStates.waiting_for_assignee)
-async def process_task_assignee(message: Message, state: FSMContext,
-                                db: Database, user: tuple):
-    task_data = await state.get_data()
-
-    # Получаем ID пользователя из текста кнопки
-    assignee_name = message.text.split(" (")[0]
-    project_users = db.get_project_users(user[4])
-    assignee = next(u for u in project_users if u[2] == assignee_name)
-
-    task_id = db.add_task(user[4], task_data["description"],
-                          task_data["deadline"], assignee[0])
-    await state.clear()
-    await message.answer(f"Задача создана и назначена на {assignee_name}!",
-                         reply_markup=get_main_keyboard(True))
-
-
-@router.message(F.text == "Мои задачи")
-async def show_tasks(message: Message, db: Database, user: tuple):
-    tasks = db.get_tasks_by_user(user[0])
-    if not tasks:
-        await message.answer("У вас пока нет активных задач.")
-        return
-
-    for task in tasks:
-        await message.answer(format_task_info(task),
-                             reply_markup=get_task_inline_keyboard(task[0]))
-
-
-@router.callback_query(F.data == "show_tasks")
-async def cb_show_tasks(callback: CallbackQuery, db: Database, user: tuple):
-    await callback.message.delete()  # Удаляем предыдущее сообщение
-
-    tasks = db.get_tasks_by_user(db.get_active_user(user[1])[0])
-    if not tasks:
-        await callback.message.answer(
-            "У вас пока нет активных задач.",
-            reply_markup=get_main_keyboard(db.get_active_role(user[1])[0] == "Manager"))
-        return
-
-    for task in tasks:
-        await callback.message.answer(format_task_info(task),
-                                      reply_markup=get_task_inline_keyboard(
-                                          task[0]))
-    await callback.answer()
-
-
-@router.callback_query(F.data.startswith("complete_task_"))
-async def complete_task(callback: CallbackQuery, db: Database, user: tuple):
-    try:
-        task_id = int(callback.data.split("_")[-1])
-        db.update_task_status(task_id, "completed")
-
-        # Проверяем, является ли пользователь менеджером
-        project = db.get_project_by_id(user[4])
-        is_manager = project[3] == callback.from_user.id
-
-        # Показываем сообщение о выполнении и возвращаем в главное меню
-        await callback.message.edit_text(
-            f"{callback.message.text}\n✅ Задача выполнена!\nВозврат в главное меню...",
-            reply_markup=None)
-
-        # Отправляем новое сообщение с главным меню
-        await callback.message.answer(
-            "Выберите действие:", reply_markup=get_main_keyboard(is_manager))
-
-        await callback.answer("Задача отмечена как выполненная!")
-
-    except Exception as e:
-        logging.error(f"Error in complete task: {e}")
-        await callback.answer("Произошла ошибка при выполнении задачи.",
-                              show_alert=True)
-
-
-@router.callback_query(F.data == "project_report")
-async def cb_project_report(callback: CallbackQuery, db: Database,
-                            user: tuple):
-    try:
-        print(db.get_active_user(user[1]))
-        project = db.get_active_project(user[1])
-        if not project:
-            await callback.answer("Проект не найден.", show_alert=True)
-            return
-
-        if project[3] != callback.from_user.id:
-            await callback.answer(
-                "Только руководитель проекта может просматривать отчеты.",
-                show_alert=True)
-            return
-
-        cursor = db.cursor.execute(
-            '''
-            SELECT 
-                t.status,
-                COUNT(*) as count,
-                u.name,
-                u.role
-            FROM tasks t
-            JOIN users u ON t.assigned_to = u.id
-            WHERE t.project_id = ?
-            GROUP BY t.status, u.name, u.role
-        ''', (user[4], ))
-        stats = cursor.fetchall()
-
-        if not stats:
-            report = f"📊 Отчет по проекту '{project[1]}'\n\nПока нет данных о задачах."
-        else:
-            report = f"📊 Отчет по проекту '{project[1]}'\n\n"
-            for stat in stats:
-                status, count, user_name, role = stat
-                report += f"{user_name} ({role}):\n"
-                report += f"- {status}: {count} задач\n"
-
-        try:
-            await callback.message.edit_text(
-                report, reply_markup=get_main_keyboard(True))
-        except Exception as e:
-            # Если не удалось отредактировать сообщение, отправляем новое
-            await callback.message.answer(report,
-                                          reply_markup=get_main_keyboard(True))
-
-        await callback.answer()
-
-    except Exception as e:
-        logging.error(f"Error in project report: {e}")
-        await callback.answer("Произошла ошибка при формировании отчета.",
-                              show_alert=True)
-
-
-@router.callback_query(F.data == "get_project_code")
-async def cb_get_project_code(callback: CallbackQuery, db: Database, user: tuple):
-    # Get active project with role
-    active_project = db.get_user_active_project(callback.from_user.id)
-    if not active_project:
-        await callback.answer(
-            "Не удалось получить информацию о текущем проекте. Попробуйте переключить проект.",
-            show_alert=True
-        )
-        return
-
-    project_data = active_project[:-1]  # Project data without role
-    user_role = active_project[-1]  # User's role in the project
-
-    # Check if user is manager of this specific project
-    if project_data[3] != callback.from_user.id:
-        await callback.answer(
-            "Только руководитель проекта может просматривать код проекта.",
-            show_alert=True
-        )
-        return
-
-    await callback.message.edit_text(
-        f"Код вашего проекта:\n\n`{project_data[2]}`\n\nПоделитесь этим кодом с участниками команды.",
-        reply_markup=get_project_code_keyboard(project_data[2]),
-        parse_mode="Markdown"
-    )
-    await callback.answer()
-
-
-@router.callback_query(F.data == "back_to_main")
-async def cb_back_to_main(callback: CallbackQuery, db: Database, user: tuple):
-    is_manager = user[3] == "Manager"
-    await callback.message.edit_text(
-        "Выберите действие:", reply_markup=get_main_keyboard(is_manager))
-    await callback.answer()
-
-
-@router.callback_query(F.data.startswith("role_"))
-async def cb_process_role(callback: CallbackQuery, state: FSMContext):
-    # Сообщаем пользователю, что нужно ввести роль текстом
-    await callback.message.answer(
-        "Пожалуйста, введите вашу роль текстом (Например: Программист, Дизайнер, Аналитик...):"
-    )
-    await callback.answer()
-
-# Add these handlers to the router section
-@router.callback_query(F.data == "switch_project")
-async def cb_switch_project(callback: CallbackQuery, db: Database):
-    # Получаем список проектов пользователя
-    projects = db.get_user_projects(callback.from_user.id)
-
-    if not projects:
-        await callback.message.edit_text(
-            "У вас пока нет других проектов. Вы можете присоединиться к существующему проекту или создать новый.",
-            reply_markup=get_main_keyboard(False)
-        )
-        return
-
-    # Создаем клавиатуру со списком проектов
-    buttons = []
-    for project in projects:
-        buttons.append([
-            InlineKeyboardButton(
-                text=f"{project[1]}",
-                callback_data=f"select_project_{project[0]}"
-            )
-        ])
-
-    # Добавляем кнопку возврата
-    buttons.append([
-        InlineKeyboardButton(
-            text="🔙 Вернуться",
-            callback_data="back_to_main"
-        )
-    ])
-
-    await callback.message.edit_text(
-        "Выберите проект:",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons)
-    )
-
-@router.callback_query(F.data.startswith("select_project_"))
-async def cb_select_project(callback: CallbackQuery, db: Database):
-    project_id = int(callback.data.split("_")[-1])
-    db.switch_user_project(callback.from_user.id, project_id)
-    project = db.get_project_by_id(project_id)
-    is_manager = project[3] == callback.from_user.id
-    
-    await callback.message.edit_text(
-        f"Проект изменен на: {project[1]}",
-        reply_markup=get_main_keyboard(is_manager)
-    )
-
-@router.callback_query(F.data == "join_project")
-async def cb_join_project(callback: CallbackQuery, state: FSMContext):
-    await state.set_state(ProjectManagementStates.waiting_for_new_project_code)
-    await callback.message.edit_text(
-        "Введите код проекта, к которому хотите присоединиться:\n\n"
-        "Для отмены нажмите кнопку 'На главную'"
-    )
-
-
-@router.message(ProjectManagementStates.waiting_for_new_project_code)
-async def process_new_project_code(message: Message, state: FSMContext, db: Database):
-    project = db.get_project(message.text)
-    if not project:
-        await message.answer(
-            "Проект не найден. Попробуйте еще раз или нажмите 'На главную' для возврата в меню."
-        )
-        return
-
-    # Проверяем, не состоит ли пользователь уже в этом проекте
-    user_projects = db.get_user_projects(message.from_user.id)
-    if any(p[0] == project[0] for p in user_projects):
-        await message.answer(
-            "Вы уже состоите в этом проекте. Используйте функцию 'Сменить проект' для переключения между проектами.",
-            reply_markup=get_main_keyboard(False)
-        )
-        await state.clear()
-        return
-
-    # Получаем роли проекта
-    project_roles = db.get_project_roles(project[0])
-
-    if not project_roles:
-        await message.answer(
-            "В проекте не определены роли. Обратитесь к менеджеру проекта."
-        )
-        await state.clear()
-        return
-
-    # Создаем клавиатуру с ролями
-    buttons = [
-        [InlineKeyboardButton(text=role, callback_data=f"join_role_{project[0]}_{role}")]
-        for role in project_roles
-    ]
-
-    # Добавляем кнопку отмены
-    buttons.append([
-        InlineKeyboardButton(text="🔙 Отмена", callback_data="back_to_main")
-    ])
-
-    await message.answer(
-        f"Выберите вашу роль в проекте '{project[1]}':",
-        reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons)
-    )
-
-
-@router.callback_query(F.data.startswith("join_role_"))
-async def process_join_role(callback: CallbackQuery, state: FSMContext, db: Database):
-    # Получаем project_id и role из callback_data
-    _, _, project_id, role = callback.data.split("_")
-    project_id = int(project_id)
-
-    try:
-        # Добавляем пользователя в новый проект
-        user_id = db.add_user(
-            callback.from_user.id,
-            callback.from_user.full_name,
-            project_id,
-            role
-        )
-
-        # Переключаем пользователя на новый проект
-        db.switch_user_project(callback.from_user.id, project_id)
-
-        # Получаем информацию о проекте
-        project = db.get_project_by_id(project_id)
-        is_manager = project[3] == callback.from_user.id
-
-        await state.clear()
-
-        await callback.message.edit_text(
-            f"✅ Вы успешно присоединились к проекту '{project[1]}'\n"
-            f"Ваша роль: {role}"
-        )
-
-        await callback.message.answer(
-            "Выберите действие:",
-            reply_markup=get_main_keyboard(is_manager)
-        )
-
-    except Exception as e:
-        logging.error(f"Error in process_join_role: {e}")
-        await callback.message.edit_text(
-            "Произошла ошибка при присоединении к проекту. Попробуйте еще раз.",
-            reply_markup=get_main_keyboard(False)
-        )
-        await state.clear()
-
-
-
-
-@router.callback_query(F.data == "delete_project")
-async def cb_delete_project(callback: CallbackQuery, state: FSMContext, db: Database):
-    project = db.get_project_by_id(db.get_user(callback.from_user.id)[4])
-    if project[3] != callback.from_user.id:
-        await callback.answer("Только владелец проекта может удалить его", show_alert=True)
-        return
-    
-    await state.set_state(ProjectManagementStates.confirm_project_deletion)
-    await callback.message.edit_text(
-        f"Вы уверены, что хотите удалить проект '{project[1]}'?\n"
-        "⚠️ Это действие нельзя отменить!\n\n"
-        "Для подтверждения напишите название проекта:"
-    )
-
-@router.message(ProjectManagementStates.confirm_project_deletion)
-async def confirm_project_deletion(message: Message, state: FSMContext, db: Database):
-    project = db.get_project_by_id(db.get_user(message.from_user.id)[4])
-    if message.text != project[1]:
-        await message.answer("Название проекта введено неверно. Операция отменена.")
-        await state.clear()
-        return
-    
-    if db.delete_project(project[0]):
-        await message.answer("Проект успешно удален.")
-    else:
-        await message.answer("Произошла ошибка при удалении проекта.")
-    
-    await state.clear()
-
-
-@router.callback_query(F.data == "create_new_project")
-async def cb_create_new_project(callback: CallbackQuery, state: FSMContext):
-    await state.set_state(ProjectCreationStates.waiting_for_name)
-    await callback.message.edit_text("Введите название нового проекта:")
-
-
-
-@router.callback_query(F.data == "view_participants")
-async def cb_view_participants(callback: CallbackQuery, db: Database):
-    # Get active project with role
-    active_project = db.get_user_active_project(callback.from_user.id)
-    if not active_project:
-        await callback.answer(
-            "Не удалось получить информацию о текущем проекте.",
-            show_alert=True
-        )
-        return
-    
-    project_data = active_project[:-2]  # Project data without role and user_id
-    user_role = active_project[-2]  # User's role
-    
-    # Check if user is manager of this project
-    if project_data[3] != callback.from_user.id:
-        await callback.answer(
-            "Только руководитель проекта может просматривать список участников.",
-            show_alert=True
-        )
-        return
-    
-    # Get project participants
-    participants = db.get_project_participants(project_data[0])
-    
-    if not participants:
-        message_text = f"В проекте '{project_data[1]}' пока нет участников."
-    else:
-        message_text = f"👥 Участники проекта '{project_data[1]}':\n\n"
-        current_role = None
-        
-        for name, role, _ in participants:
-            if role != current_role:
-                message_text += f"\n{role}:\n"
-                current_role = role
-            message_text += f"- {name}\n"
-    
-    # Add back button
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔙 Вернуться", callback_data="back_to_main")]
-    ])
-    
-    await callback.message.edit_text(
-        message_text,
-        reply_markup=keyboard
-    )
-
-
-
-
-
-
-
-class FeedbackStates(StatesGroup):
-    waiting_for_bot_feedback = State()
-
-
-@router.callback_query(F.data == "bot_feedback")
-async def cb_bot_feedback(callback: CallbackQuery, state: FSMContext):
-    await state.set_state(FeedbackStates.waiting_for_bot_feedback)
-    await callback.message.edit_text(
-        "Пожалуйста, поделитесь вашим мнением о работе бота.\n"
-        "Что можно улучшить? Какие функции добавить?\n"
-        "Ваш отзыв поможет сделать бота лучше!"
-    )
-
-@router.message(FeedbackStates.waiting_for_bot_feedback)
-async def process_bot_feedback(message: Message, state: FSMContext, db: Database):
-    db.add_bot_feedback(message.from_user.id, message.text)
-    await state.clear()
-    await message.answer(
-        "Спасибо за ваш отзыв! Мы учтем его для улучшения работы бота.",
-        reply_markup=get_main_keyboard(
-            db.get_project_by_id(db.get_user(message.from_user.id)[4])[3] == message.from_user.id
-        )
-    )
-
-@router.message()
-async def handle_unknown(message: Message, state: FSMContext):
-    current_state = await state.get_state()
-    if current_state:
-        # Если пользователь в процессе регистрации, показываем соответствующее сообщение
-        if current_state == RegistrationStates.waiting_for_name.state:
-            await message.answer("Пожалуйста, введите ваше имя.")
-        elif current_state == RegistrationStates.waiting_for_project_code.state:
-            await message.answer(
-                "Пожалуйста, введите код проекта или используйте /create для создания нового проекта."
-            )
-        elif current_state == RegistrationStates.waiting_for_role.state:
-            await message.answer(
-                "Пожалуйста, выберите роль, используя кнопки ниже:",
-                reply_markup=get_role_keyboard())
-    else:
-        # Если пользователь не в процессе регистрации
-        await message.answer(
-            "Извините, я не понимаю эту команду. Используйте доступные кнопки меню или /start для начала работы."
-        )
-
-
-# Планировщик задач
-class TaskScheduler:
-
-    def __init__(self, bot: Bot, db: Database):
-        self.scheduler = AsyncIOScheduler()
-        self.bot = bot
-        self.db = db
-
-        # Добавляем задачу на проверку дедлайнов каждый час
-        self.scheduler.add_job(self.check_deadlines, 'interval', hours=1)
-
-    async def check_deadlines(self):
-        """Проверяет приближающиеся дедлайны и отправляет уведомления"""
-        now = datetime.now()
-        deadline_threshold = now + timedelta(hours=24)
-
-        # Получаем задачи с приближающимися дедлайнами
-        cursor = self.db.cursor.execute(
-            '''
-            SELECT 
-                t.id,
-                t.description,
-                t.deadline,
-                u.telegram_id,
-                p.manager_id
-            FROM tasks t
-            JOIN users u ON t.assigned_to = u.id
-            JOIN projects p ON t.project_id = p.id
-            WHERE t.status != 'completed'
-            AND t.deadline <= ?
-            AND t.deadline > ?
-        ''', (deadline_threshold.strftime('%Y-%m-%d %H:%M:%S'),
-              now.strftime('%Y-%m-%d %H:%M:%S')))
-
-        upcoming_tasks = cursor.fetchall()
-
-        for task in upcoming_tasks:
-            task_id, description, deadline, user_id, manager_id = task
-            deadline_dt = datetime.strptime(deadline, '%Y-%m-%d %H:%M:%S')
-            hours_left = int((deadline_dt - now).total_seconds() / 3600)
-
-            # Уведомление исполнителю
-            await self.bot.send_message(
-                user_id, f"⚠️ Напоминание!\n"
-                f"До дедлайна задачи #{task_id} осталось {hours_left} часов!\n"
-                f"Описание: {description}")
-
-            # Если осталось менее 2 часов, уведомляем менеджера
-            if hours_left <= 2:
-                await self.bot.send_message(
-                    manager_id, f"🚨 Внимание!\n"
-                    f"Задача #{task_id} может быть не выполнена вовремя!\n"
-                    f"До дедлайна осталось {hours_left} часов.\n"
-                    f"Описание: {description}")
-
-    def start(self):
-        """Запускает планировщик"""
-        self.scheduler.start()
-
-
-async def main():
-    # Настройка логирования
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
-
-    # Загрузка конфигурации
-    config = load_config()
-
-    # Инициализация бота и диспетчера
-    bot = Bot(token=config.token)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
-
-    # Инициализация базы данных
-    db = Database("project_bot.db")
-
-    # Создаем middleware с передачей базы данных
-    user_middleware = UserCheckMiddleware(db)
-    callback_middleware = CallbackMiddleware(db)
-
-    # Регистрируем middleware
-    dp.message.middleware(user_middleware)
-    dp.callback_query.middleware(callback_middleware)
-
-    # Регистрация роутера
-    dp.include_router(router)
-
-    # Инициализация и запуск планировщика задач
-    scheduler = TaskScheduler(bot, db)
-    scheduler.start()
-
-    try:
-        await dp.start_polling(bot)
-    finally:
-        await bot.session.close()
-
-
-if __name__ == "__main__":
-    asyncio.run(main())
+import asyncio
+import concurrent.futures
+import functools
+import json
+import logging
+import sqlite3
+from datetime import datetime, timedelta
+import base64
+import secrets
+from dotenv import load_dotenv, dotenv_values
+from typing import Dict, Any, Callable, Awaitable, Optional, Union
+import os
+import aiosqlite
+from aiogram import Bot, Dispatcher, Router, BaseMiddleware, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+from aiogram.types import (Message, CallbackQuery, ReplyKeyboardMarkup,
+                           KeyboardButton, InlineKeyboardMarkup,
+                           InlineKeyboardButton, ReplyKeyboardRemove)
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from environs import Env
+from dataclasses import dataclass
+from gradio_client import Client
+
+load_dotenv()
+
+
+# Конфигурация
+
+@dataclass
+class Config:
+    token: str
+    admin_ids: list[int]
+    openai_api_key: str
+    qwen_url: str
+
+
+def load_config() -> Config:
+    return Config(
+        token=os.getenv("BOT_TOKEN"),
+        admin_ids=list(map(int, os.getenv("ADMIN_IDS").split(','))),
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        qwen_url=os.getenv("QWEN_URL", "Qwen/Qwen2.5")  # Добавляем URL по умолчанию
+    )
+
+
+# База данных
+
+# Предельный размер in-memory кешей пользователей и проектов
+CACHE_MAX_SIZE = 4096
+
+
+class Database:
+
+    def __init__(self, connection: aiosqlite.Connection):
+        self.connection = connection
+        # Отдельное read-only соединение назначается в connect() после
+        # создания таблиц; до этого чтения идут через писателя
+        self.read_connection = connection
+        # Кеш горячих строк: middleware дергает get_user на каждом апдейте,
+        # а данные меняются редко
+        self._user_cache: Dict[int, tuple] = {}
+        self._user_project_cache: Dict[int, tuple] = {}
+        self._active_project_cache: Dict[int, tuple] = {}
+        self._project_cache: Dict[int, tuple] = {}
+        # Отзывы о боте не критичны к задержке - копим в буфере
+        # и сбрасываем пачкой одним executemany (см. SqliteStorage)
+        self._feedback_buf: list = []
+        self._feedback_task: Optional[asyncio.Task] = None
+        # Сериализует многошаговые записи и фоновый флаш отзывов:
+        # aiosqlite перемежает операции разных задач на одном соединении,
+        # и чужой commit посреди серии DML разорвал бы ее на две транзакции
+        self._write_lock = asyncio.Lock()
+
+    @staticmethod
+    def _cache_put(cache: Dict[int, Any], key: int, value: Any):
+        if len(cache) >= CACHE_MAX_SIZE:
+            # Вытесняем самую старую запись (dict сохраняет порядок вставки)
+            cache.pop(next(iter(cache)))
+        cache[key] = value
+
+    @classmethod
+    async def connect(cls, db_file: str) -> "Database":
+        """Открывает одно долгоживущее соединение для всего event loop"""
+        # Увеличенный кеш подготовленных стейтментов: одинаковые SQL-строки
+        # не перекомпилируются в VDBE-байткод на каждый вызов
+        connection = await aiosqlite.connect(db_file, cached_statements=256)
+        # sqlite3.Row реализован на C и по скорости равен tuple,
+        # но позволяет обращаться к колонкам по имени
+        connection.row_factory = sqlite3.Row
+
+        # Настраиваем SQLite для конкурентного доступа без блокировки loop
+        await connection.execute('PRAGMA journal_mode=WAL')
+        await connection.execute('PRAGMA synchronous=NORMAL')
+        await connection.execute('PRAGMA temp_store=memory')
+        await connection.execute('PRAGMA cache_size=-64000')
+        await connection.execute('PRAGMA mmap_size=268435456')
+        await connection.execute('PRAGMA busy_timeout=5000')
+        await connection.execute('PRAGMA foreign_keys=ON')
+
+        db = cls(connection)
+        await db._create_tables()
+
+        # Отдельное read-only соединение: в WAL-режиме чтения не ждут
+        # в очереди рабочего потока писателя за commit/fsync
+        read_connection = await aiosqlite.connect(
+            f'file:{db_file}?mode=ro', uri=True, cached_statements=256)
+        read_connection.row_factory = sqlite3.Row
+        await read_connection.execute('PRAGMA temp_store=memory')
+        await read_connection.execute('PRAGMA cache_size=-64000')
+        await read_connection.execute('PRAGMA mmap_size=268435456')
+        await read_connection.execute('PRAGMA busy_timeout=5000')
+        db.read_connection = read_connection
+        db._feedback_task = asyncio.create_task(db._feedback_flush_loop())
+        return db
+
+    async def _create_tables(self):
+        await self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS projects (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                code TEXT UNIQUE NOT NULL,
+                manager_id INTEGER NOT NULL
+            )
+        ''')
+        await self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY,
+                    telegram_id INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    role TEXT,
+                    project_id INTEGER,
+                    is_active INTEGER DEFAULT 0,
+                    FOREIGN KEY (project_id) REFERENCES projects (id)
+                        ON DELETE CASCADE
+                )
+            ''')
+
+        await self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS project_roles (
+                id INTEGER PRIMARY KEY,
+                project_id INTEGER NOT NULL,
+                role_name TEXT NOT NULL,
+                FOREIGN KEY (project_id) REFERENCES projects (id)
+                    ON DELETE CASCADE,
+                UNIQUE(project_id, role_name)
+            )
+        ''')
+
+        await self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY,
+                project_id INTEGER NOT NULL,
+                description TEXT NOT NULL,
+                deadline DATETIME NOT NULL,
+                assigned_to INTEGER,
+                status TEXT DEFAULT 'pending',
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (project_id) REFERENCES projects (id)
+                    ON DELETE CASCADE,
+                FOREIGN KEY (assigned_to) REFERENCES users (id)
+            )
+        ''')
+
+        # Индексы для горячих выборок - иначе по мере роста таблиц
+        # каждый запрос превращается в полный скан
+        await self.connection.execute('''
+            CREATE INDEX IF NOT EXISTS ix_tasks_assignee_status_deadline
+            ON tasks(assigned_to, status, deadline)
+        ''')
+        await self.connection.execute('''
+            CREATE INDEX IF NOT EXISTS ix_users_project_role
+            ON users(project_id, role)
+        ''')
+        await self.connection.execute('''
+            CREATE INDEX IF NOT EXISTS ix_project_roles_project
+            ON project_roles(project_id)
+        ''')
+        await self.connection.execute('''
+            CREATE INDEX IF NOT EXISTS ix_users_project_name
+            ON users(project_id, name)
+        ''')
+        # Отчет по проекту: seek по project_id и группировка в порядке индекса
+        # вместо полного скана tasks + temp B-tree
+        await self.connection.execute('''
+            CREATE INDEX IF NOT EXISTS ix_tasks_project_status_assignee
+            ON tasks(project_id, status, assigned_to)
+        ''')
+        # Поиск пользователя по telegram_id - самый горячий запрос
+        # (middleware на каждом апдейте). Уникальность по паре
+        # (telegram_id, project_id): один пользователь состоит в нескольких
+        # проектах, но в каждом - только один раз
+        await self.connection.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS ix_users_telegram_project
+            ON users(telegram_id, project_id)
+        ''')
+        await self.connection.execute('''
+            CREATE INDEX IF NOT EXISTS ix_projects_manager
+            ON projects(manager_id)
+        ''')
+        # Частичный индекс для планировщика дедлайнов: range seek только
+        # по незавершенным задачам
+        await self.connection.execute('''
+            CREATE INDEX IF NOT EXISTS ix_tasks_open_deadline
+            ON tasks(deadline) WHERE status != 'completed'
+        ''')
+
+        await self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS task_feedback (
+                id INTEGER PRIMARY KEY,
+                task_id INTEGER NOT NULL,
+                feedback TEXT NOT NULL,
+                rating INTEGER NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (task_id) REFERENCES tasks (id)
+                    ON DELETE CASCADE
+            )
+        ''')
+
+        await self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS bot_feedback (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                feedback TEXT NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        await self.connection.commit()
+
+    async def add_project(self, name: str, code: str, manager_id: int) -> int:
+        cursor = await self.connection.execute(
+            'INSERT INTO projects (name, code, manager_id) VALUES (?, ?, ?)',
+            (name, code, manager_id))
+        await self.connection.commit()
+        return cursor.lastrowid
+
+    async def add_user(self, telegram_id: int, name: str, project_id: int = None, role: str = None) -> int:
+        """Add user to a project. If user exists in other projects, add new project entry."""
+        try:
+            # Один запрос вместо SELECT-затем-INSERT: уникальный индекс по
+            # (telegram_id, project_id) гасит дубликат, RETURNING отдает id
+            cursor = await self.connection.execute(
+                '''INSERT INTO users (telegram_id, name, project_id, role)
+                   VALUES (?, ?, ?, ?)
+                   ON CONFLICT(telegram_id, project_id) DO NOTHING
+                   RETURNING id''',
+                (telegram_id, name, project_id, role)
+            )
+            row = await cursor.fetchone()
+            await self.connection.commit()
+
+            if row is None:
+                # Пользователь уже состоит в этом проекте - берем его id
+                cursor = await self.connection.execute(
+                    'SELECT id FROM users WHERE telegram_id = ? AND project_id = ?',
+                    (telegram_id, project_id)
+                )
+                row = await cursor.fetchone()
+                return row[0]
+
+            self._user_cache.pop(telegram_id, None)
+            self._user_project_cache.pop(telegram_id, None)
+            self._active_project_cache.pop(telegram_id, None)
+            return row[0]
+
+        except sqlite3.Error as e:
+            logging.error(f"Error in add_user: {e}")
+            raise
+
+    async def add_task(self,
+                       project_id: int,
+                       description: str,
+                       deadline: datetime,
+                       assigned_to: int = None) -> int:
+        # Каноничный ISO-текст вместо неявного адаптера datetime
+        # (deprecated с Python 3.12); читатели режут строку без парсинга
+        cursor = await self.connection.execute(
+            'INSERT INTO tasks (project_id, description, deadline, assigned_to) VALUES (?, ?, ?, ?)',
+            (project_id, description,
+             deadline.isoformat(sep=' ', timespec='seconds'), assigned_to))
+        await self.connection.commit()
+        return cursor.lastrowid
+
+    async def get_user(self, telegram_id: int):
+        if telegram_id in self._user_cache:
+            return self._user_cache[telegram_id]
+        # Явные колонки: is_active читателям не нужен
+        cursor = await self.read_connection.execute(
+            'SELECT id, telegram_id, name, role, project_id FROM users WHERE telegram_id = ?',
+            (telegram_id, ))
+        user = await cursor.fetchone()
+        self._cache_put(self._user_cache, telegram_id, user)
+        return user
+
+    async def get_user_with_project(self, telegram_id: int):
+        """Строка пользователя вместе с manager_id его проекта одним запросом"""
+        if telegram_id in self._user_project_cache:
+            return self._user_project_cache[telegram_id]
+        cursor = await self.read_connection.execute('''
+            SELECT u.id, u.telegram_id, u.name, u.role, u.project_id,
+                   p.manager_id
+            FROM users u
+            LEFT JOIN projects p ON p.id = u.project_id
+            WHERE u.telegram_id = ?
+        ''', (telegram_id,))
+        row = await cursor.fetchone()
+        self._cache_put(self._user_project_cache, telegram_id, row)
+        return row
+
+    async def get_project(self, code: str):
+        cursor = await self.read_connection.execute(
+            'SELECT * FROM projects WHERE code = ?', (code, ))
+        return await cursor.fetchone()
+
+    async def get_project_by_id(self, project_id: int):
+        if project_id is None:
+            return None
+        if project_id in self._project_cache:
+            return self._project_cache[project_id]
+        cursor = await self.read_connection.execute(
+            'SELECT * FROM projects WHERE id = ?', (project_id,))
+        project = await cursor.fetchone()
+        self._cache_put(self._project_cache, project_id, project)
+        return project
+
+    async def get_user_by_id(self, user_id: int):
+        cursor = await self.read_connection.execute(
+            'SELECT id, telegram_id, name, role FROM users WHERE id = ?',
+            (user_id, ))
+        return await cursor.fetchone()
+
+    async def get_task_by_id(self, task_id: int):
+        cursor = await self.read_connection.execute(
+            '''SELECT id, project_id, description, deadline, assigned_to,
+                      status, created_at
+               FROM tasks WHERE id = ?''', (task_id, ))
+        return await cursor.fetchone()
+
+    async def get_tasks_by_user(self, user_id: int):
+        # Явный список колонок вместо SELECT * - ровно то, что читает format_task_info
+        cursor = await self.read_connection.execute(
+            '''
+            SELECT id, project_id, description, deadline, assigned_to, status, created_at
+            FROM tasks
+            WHERE assigned_to = ? AND status != 'completed'
+            ORDER BY deadline
+        ''', (user_id, ))
+        return await cursor.fetchall()
+
+    async def get_user_by_project_and_name(self, project_id: int, name: str):
+        """Находит участника проекта по имени одним индексированным запросом"""
+        cursor = await self.read_connection.execute(
+            'SELECT id FROM users WHERE project_id = ? AND name = ? LIMIT 1',
+            (project_id, name))
+        return await cursor.fetchone()
+
+    async def get_project_users(self, project_id: int):
+        # Вызывающим нужны только id, имя и роль
+        cursor = await self.read_connection.execute(
+            'SELECT id, name, role FROM users WHERE project_id = ?',
+            (project_id, ))
+        return await cursor.fetchall()
+
+    async def update_task_status(self, task_id: int, status: str):
+        await self.connection.execute(
+            'UPDATE tasks SET status = ? WHERE id = ?', (status, task_id))
+        await self.connection.commit()
+
+    async def update_user_role(self, user_id: int, role: str):
+        await self.connection.execute(
+            'UPDATE users SET role = ? WHERE id = ?', (role, user_id))
+        await self.connection.commit()
+        # user_id - это внутренний id, telegram_id неизвестен, сбрасываем весь кеш
+        self._user_cache.clear()
+        self._user_project_cache.clear()
+        self._active_project_cache.clear()
+
+    async def add_project_roles(self, project_id: int, roles: list):
+        """Добавляет роли проекта одной пачкой в одной транзакции"""
+        # OR IGNORE отбрасывает дубликаты ролей без try/except
+        await self.connection.executemany(
+            'INSERT OR IGNORE INTO project_roles (project_id, role_name) VALUES (?, ?)',
+            [(project_id, role) for role in roles]
+        )
+        await self.connection.commit()
+
+    async def get_project_roles(self, project_id: int) -> list:
+        cursor = await self.read_connection.execute(
+            'SELECT role_name FROM project_roles WHERE project_id = ?',
+            (project_id,)
+        )
+        return [role[0] for role in await cursor.fetchall()]
+
+    async def get_user_active_project(self, telegram_id: int) -> tuple:
+        """Get user's currently active project along with their role"""
+        if telegram_id in self._active_project_cache:
+            return self._active_project_cache[telegram_id]
+        cursor = await self.read_connection.execute('''
+            SELECT p.*, u.role, u.id as user_id
+            FROM projects p
+            JOIN users u ON p.id = u.project_id
+            WHERE u.telegram_id = ? AND u.is_active = 1
+        ''', (telegram_id,))
+        row = await cursor.fetchone()
+        self._cache_put(self._active_project_cache, telegram_id, row)
+        return row
+
+    async def get_active_project_if_manager(self, telegram_id: int):
+        """Активный проект пользователя, только если он его руководитель.
+
+        Пустой результат означает "нет активного проекта" или "не менеджер" -
+        оба случая обрабатываются одной веткой без второго запроса.
+        """
+        cursor = await self.read_connection.execute('''
+            SELECT p.* FROM projects p
+            JOIN users u ON p.id = u.project_id
+            WHERE u.telegram_id = ? AND u.is_active = 1 AND p.manager_id = ?
+        ''', (telegram_id, telegram_id))
+        return await cursor.fetchone()
+
+    async def get_project_participants(self, project_id: int) -> list:
+        """Get all participants of a project with their roles"""
+        cursor = await self.read_connection.execute('''
+            SELECT u.name, u.role, u.telegram_id
+            FROM users u
+            WHERE u.project_id = ?
+            ORDER BY u.role, u.name
+        ''', (project_id,))
+        return await cursor.fetchall()
+
+    # Add to the Database class
+    async def get_user_projects(self, telegram_id: int) -> list:
+        """Get all projects where user is a member"""
+        cursor = await self.read_connection.execute('''
+            SELECT DISTINCT p.*
+            FROM projects p
+            JOIN users u ON p.id = u.project_id
+            WHERE u.telegram_id = ?
+        ''', (telegram_id,))
+        return await cursor.fetchall()
+
+    # Изменить метод в классе Database
+    async def switch_user_project(self, telegram_id: int, project_id: int) -> bool:
+        """Switch user's active project"""
+        try:
+            # First verify the project exists
+            project = await self.get_project_by_id(project_id)
+            if not project:
+                return False
+
+            async with self._write_lock:
+                # Update last_active status for all user's projects
+                await self.connection.execute('''
+                    UPDATE users
+                    SET is_active = 0
+                    WHERE telegram_id = ?
+                ''', (telegram_id,))
+
+                # Set the selected project as active
+                await self.connection.execute('''
+                    UPDATE users
+                    SET is_active = 1
+                    WHERE telegram_id = ? AND project_id = ?
+                ''', (telegram_id, project_id))
+
+                await self.connection.commit()
+            self._user_cache.pop(telegram_id, None)
+            self._user_project_cache.pop(telegram_id, None)
+            self._active_project_cache.pop(telegram_id, None)
+            return True
+        except Exception as e:
+            logging.error(f"Error in switch_user_project: {e}")
+            return False
+
+    async def delete_project(self, project_id: int) -> bool:
+        """Delete project and all related data"""
+        try:
+            # Явные DELETE по дочерним таблицам внутри одной транзакции:
+            # базы, созданные до каскадных FK, не перестроить задним числом,
+            # а полагаться на каскад там нельзя
+            async with self._write_lock:
+                await self.connection.execute('''
+                    DELETE FROM task_feedback WHERE task_id IN
+                        (SELECT id FROM tasks WHERE project_id = ?)
+                ''', (project_id,))
+                await self.connection.execute(
+                    'DELETE FROM tasks WHERE project_id = ?', (project_id,))
+                await self.connection.execute(
+                    'DELETE FROM project_roles WHERE project_id = ?', (project_id,))
+                await self.connection.execute(
+                    'DELETE FROM users WHERE project_id = ?', (project_id,))
+                await self.connection.execute(
+                    'DELETE FROM projects WHERE id = ?', (project_id,))
+                await self.connection.commit()
+            # Участники проекта и сам проект изменились - кеши устарели.
+            # Текст с кодом тоже: SQLite переиспользует rowid, и новый
+            # проект может унаследовать id удаленного
+            self._user_cache.clear()
+            self._user_project_cache.clear()
+            self._active_project_cache.clear()
+            self._project_cache.pop(project_id, None)
+            _code_text_cache.pop(project_id, None)
+            return True
+        except Exception:
+            return False
+
+    async def add_feedback(self, task_id: int, feedback: str, rating: int):
+        """Add feedback for completed task"""
+        await self.connection.execute(
+            'INSERT INTO task_feedback (task_id, feedback, rating) VALUES (?, ?, ?)',
+            (task_id, feedback, rating)
+        )
+        await self.connection.commit()
+
+    # Интервал фонового сброса буфера отзывов на диск, секунды
+    FEEDBACK_FLUSH_INTERVAL = 30.0
+    # Принудительный сброс, когда буфер разросся
+    FEEDBACK_FLUSH_THRESHOLD = 100
+
+    async def add_bot_feedback(self, user_id: int, feedback: str):
+        """Add feedback about bot (отложенная запись из буфера)"""
+        self._feedback_buf.append((user_id, feedback))
+        if len(self._feedback_buf) >= self.FEEDBACK_FLUSH_THRESHOLD:
+            await self.flush_feedback()
+
+    async def flush_feedback(self):
+        """Сбрасывает накопленные отзывы одной транзакцией"""
+        if not self._feedback_buf:
+            return
+        rows, self._feedback_buf = self._feedback_buf, []
+        async with self._write_lock:
+            await self.connection.executemany(
+                'INSERT INTO bot_feedback (user_id, feedback) VALUES (?, ?)',
+                rows)
+            await self.connection.commit()
+
+    async def _feedback_flush_loop(self):
+        while True:
+            await asyncio.sleep(self.FEEDBACK_FLUSH_INTERVAL)
+            try:
+                await self.flush_feedback()
+            except Exception as e:
+                logging.error(f"Error flushing bot feedback: {e}")
+
+
+# Хранилище FSM
+class SqliteStorage(BaseStorage):
+    """FSM-хранилище поверх aiosqlite с write-back кешем в памяти.
+
+    Чтения и записи идут через dict, поэтому горячий путь не трогает диск;
+    "грязные" ключи периодически сбрасываются в таблицу fsm одной пачкой,
+    так что состояние диалогов переживает рестарт бота.
+    """
+
+    # Интервал фонового сброса грязных записей на диск, секунды
+    FLUSH_INTERVAL = 0.5
+
+    def __init__(self, connection: aiosqlite.Connection):
+        self.connection = connection
+        self._states: Dict[tuple, Optional[str]] = {}
+        self._data: Dict[tuple, Dict[str, Any]] = {}
+        self._loaded: set = set()
+        self._dirty: set = set()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    async def create(cls, db_file: str) -> "SqliteStorage":
+        # Собственное соединение: commit из фонового флаша не должен
+        # вклиниваться между стейтментами многошаговых записей Database
+        connection = await aiosqlite.connect(db_file, cached_statements=256)
+        await connection.execute('PRAGMA journal_mode=WAL')
+        await connection.execute('PRAGMA synchronous=NORMAL')
+        await connection.execute('PRAGMA busy_timeout=5000')
+        storage = cls(connection)
+        await connection.execute('''
+            CREATE TABLE IF NOT EXISTS fsm (
+                chat_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                state TEXT,
+                data TEXT,
+                PRIMARY KEY (chat_id, user_id)
+            )
+        ''')
+        await connection.commit()
+        storage._flush_task = asyncio.get_running_loop().create_task(
+            storage._flush_loop())
+        return storage
+
+    @staticmethod
+    def _key(key: StorageKey) -> tuple:
+        return (key.chat_id, key.user_id)
+
+    async def _load(self, k: tuple):
+        """Подтягивает запись из SQLite при первом обращении к ключу"""
+        if k in self._loaded:
+            return
+        cursor = await self.connection.execute(
+            'SELECT state, data FROM fsm WHERE chat_id = ? AND user_id = ?', k)
+        row = await cursor.fetchone()
+        if row:
+            self._states[k] = row[0]
+            self._data[k] = json.loads(row[1]) if row[1] else {}
+        self._loaded.add(k)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = self._key(key)
+        await self._load(k)
+        self._states[k] = state.state if isinstance(state, State) else state
+        self._dirty.add(k)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        k = self._key(key)
+        await self._load(k)
+        return self._states.get(k)
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        k = self._key(key)
+        await self._load(k)
+        self._data[k] = data
+        self._dirty.add(k)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        k = self._key(key)
+        await self._load(k)
+        return dict(self._data.get(k, {}))
+
+    async def _flush(self):
+        """Сбрасывает накопившиеся изменения в SQLite одной пачкой"""
+        if not self._dirty:
+            return
+        dirty = list(self._dirty)
+        self._dirty.clear()
+        rows = [(chat_id, user_id,
+                 self._states.get((chat_id, user_id)),
+                 json.dumps(self._data.get((chat_id, user_id), {})))
+                for chat_id, user_id in dirty]
+        await self.connection.executemany('''
+            INSERT INTO fsm (chat_id, user_id, state, data)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(chat_id, user_id) DO UPDATE SET
+                state = excluded.state,
+                data = excluded.data
+        ''', rows)
+        await self.connection.commit()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.FLUSH_INTERVAL)
+            try:
+                await self._flush()
+            except Exception as e:
+                logging.error(f"Error flushing FSM storage: {e}")
+
+    async def close(self) -> None:
+        if self._flush_task:
+            self._flush_task.cancel()
+        await self._flush()
+
+
+# Состояния FSM
+class RegistrationStates(StatesGroup):
+    waiting_for_name = State()
+    waiting_for_project_code = State()
+    waiting_for_role = State()
+
+
+class ProjectCreationStates(StatesGroup):
+    waiting_for_name = State()
+    waiting_for_roles = State()
+
+class TaskCreationStates(StatesGroup):
+    waiting_for_description = State()
+    waiting_for_deadline = State()
+    waiting_for_assignee = State()
+
+# Add to the States section
+class ProjectManagementStates(StatesGroup):
+    waiting_for_new_project_code = State()
+    confirm_project_deletion = State()
+
+
+# Клавиатуры
+# Статичные клавиатуры строятся один раз при импорте - их содержимое
+# не меняется, а пересоздание Pydantic-объектов на каждый вызов не бесплатно
+_HOME_KB = ReplyKeyboardMarkup(
+    keyboard=[[KeyboardButton(text="На главную")]],
+    resize_keyboard=True,
+    persistent=True  # Кнопка будет постоянно видна
+)
+
+_ROLE_KB = ReplyKeyboardMarkup(
+    keyboard=[[KeyboardButton(text="Программист")],
+              [KeyboardButton(text="Дизайнер")],
+              [KeyboardButton(text="Аналитик")]],
+    resize_keyboard=True,
+    one_time_keyboard=True)
+
+
+def get_home_button() -> ReplyKeyboardMarkup:
+    return _HOME_KB
+
+def get_role_keyboard() -> ReplyKeyboardMarkup:
+    return _ROLE_KB
+
+
+def _build_main_keyboard(is_manager: bool = False) -> InlineKeyboardMarkup:
+    buttons = [[
+        InlineKeyboardButton(text="📋 Мои задачи", callback_data="show_tasks")
+    ],
+    [
+        InlineKeyboardButton(text="🔄 Сменить проект", callback_data="switch_project")
+    ],
+    [
+        InlineKeyboardButton(text="➕ Присоединиться к проекту", callback_data="join_project")
+    ],
+    [
+        InlineKeyboardButton(text="📝 Создать новый проект", callback_data="create_new_project")
+    ],
+    [
+        InlineKeyboardButton(text="📢 Оставить отзыв о боте", callback_data="bot_feedback")
+    ]]
+
+    if is_manager:
+        buttons.extend([
+            [InlineKeyboardButton(text="✏️ Создать задачу", callback_data="create_task")],
+            [InlineKeyboardButton(text="📊 Отчет по проекту", callback_data="project_report")],
+            [InlineKeyboardButton(text="👥 Участники проекта", callback_data="view_participants")],
+            [InlineKeyboardButton(text="🔑 Узнать код проекта", callback_data="get_project_code")],
+            [InlineKeyboardButton(text="❌ Удалить проект", callback_data="delete_project")]
+        ])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+_MAIN_KB_USER = _build_main_keyboard(False)
+_MAIN_KB_MANAGER = _build_main_keyboard(True)
+
+
+def get_main_keyboard(is_manager: bool = False) -> InlineKeyboardMarkup:
+    return _MAIN_KB_MANAGER if is_manager else _MAIN_KB_USER
+
+
+@functools.lru_cache(maxsize=1024)
+def get_project_code_keyboard(project_code: str) -> InlineKeyboardMarkup:
+    buttons = [[
+        InlineKeyboardButton(text="🔙 Вернуться", callback_data="back_to_main")
+    ]]
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+# Пикеры ролей и проектов зависят только от содержимого, поэтому ключ
+# кеша - само содержимое; смена ролей или проектов дает новый ключ,
+# отдельная инвалидация не нужна
+@functools.lru_cache(maxsize=512)
+def get_join_role_keyboard(project_id: int, roles: tuple) -> InlineKeyboardMarkup:
+    buttons = [
+        [InlineKeyboardButton(text=role,
+                              callback_data=f"join_role_{project_id}_{role}")]
+        for role in roles
+    ]
+    buttons.append([
+        InlineKeyboardButton(text="🔙 Отмена", callback_data="back_to_main")
+    ])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+@functools.lru_cache(maxsize=512)
+def get_project_picker_keyboard(projects: tuple) -> InlineKeyboardMarkup:
+    buttons = [
+        [InlineKeyboardButton(text=name,
+                              callback_data=f"select_project_{project_id}")]
+        for project_id, name in projects
+    ]
+    buttons.append([
+        InlineKeyboardButton(text="🔙 Вернуться", callback_data="back_to_main")
+    ])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+# task_id в рамках сессии повторяются, кешируем готовые клавиатуры
+@functools.lru_cache(maxsize=2048)
+def get_task_inline_keyboard(task_id: int) -> InlineKeyboardMarkup:
+    buttons = [
+        [
+            InlineKeyboardButton(
+                text="✅ Отметить выполненной",
+                callback_data=f"complete_task_{task_id}"
+            )
+        ],
+        [
+            InlineKeyboardButton(
+                text="📋 Детали",
+                callback_data=f"task_details_{task_id}"
+            )
+        ],
+        [
+            InlineKeyboardButton(
+                text="⭐ Оставить отзыв",
+                callback_data=f"leave_feedback_{task_id}"
+            )
+        ]
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+# Middleware
+
+# Группы состояний, в которых пользователь без регистрации может общаться с ботом
+_ALLOWED_STATE_GROUPS = frozenset({"RegistrationStates", "ProjectCreationStates"})
+
+# Тексты, чьи обработчики срабатывают в любом состоянии и читают data["user"]
+_USER_REQUIRED_TEXTS = frozenset({"/start", "На главную"})
+
+
+class AuthMiddleware(BaseMiddleware):
+    """Единая проверка регистрации для Message и CallbackQuery.
+
+    Раньше жила в двух одинаковых классах; различаются только команда
+    /start (разрешена незарегистрированным) и способ показать отказ.
+    """
+
+    def __init__(self, database: Database):
+        self.database = database
+        super().__init__()
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        # Get the current state from FSMContext
+        state: FSMContext = data.get("state")
+        if state:
+            current_state = await state.get_state()
+        else:
+            current_state = None
+
+        state_group = current_state.split(":", 1)[0] if current_state else None
+
+        is_message = isinstance(event, Message)
+
+        # Текстовые шаги регистрации/создания проекта не читают data["user"] -
+        # для них строка в users еще не существует, запрос не нужен.
+        # Колбэки пропускать нельзя: зарегистрированный пользователь может
+        # нажать кнопку старого меню, и ее обработчику нужна строка.
+        # То же для /start и "На главную" - их обработчики ловят сообщение
+        # в любом состоянии и решают по data["user"], показывать ли меню
+        if (is_message and state_group in _ALLOWED_STATE_GROUPS
+                and event.text not in _USER_REQUIRED_TEXTS):
+            data["user"] = None
+            data["project_manager_id"] = None
+            data["db"] = self.database
+            return await handler(event, data)
+
+        # Один JOIN вместо get_user + get_project_by_id в обработчиках
+        user = await self.database.get_user_with_project(event.from_user.id)
+
+        # Allow updates if:
+        # 1. It's the /start command
+        # 2. User exists
+        # 3. User is in registration or project creation state
+        if (
+            user is not None
+            or state_group in _ALLOWED_STATE_GROUPS
+            or (is_message and event.text == "/start")
+        ):
+            data["user"] = user
+            data["project_manager_id"] = user["manager_id"] if user else None
+            data["db"] = self.database
+            return await handler(event, data)
+
+        if is_message:
+            await event.answer(
+                "Пожалуйста, сначала зарегистрируйтесь с помощью команды /start"
+            )
+        else:
+            await event.answer(
+                "Пожалуйста, сначала зарегистрируйтесь с помощью команды /start",
+                show_alert=True
+            )
+        return
+
+
+# Утилиты
+
+# Ограничиваем параллелизм отправки сообщений, чтобы не упереться
+# в лимиты Telegram на чат
+SEND_CONCURRENCY = asyncio.Semaphore(5)
+
+# Глобальный темп исходящих вызовов: Telegram дает боту ~30 сообщений
+# в секунду суммарно по всем чатам
+_SEND_MIN_INTERVAL = 1 / 30
+_send_pace_lock = asyncio.Lock()
+_next_send_time = 0.0
+
+
+async def send_limited(coro: Awaitable[Any]) -> Any:
+    """Отправка с общим ограничением темпа.
+
+    Выдерживает паузу между отправками, а при 429 от Telegram сдвигает
+    общее окно на retry_after, чтобы очередь не долбила API повторно.
+    """
+    global _next_send_time
+    async with SEND_CONCURRENCY:
+        async with _send_pace_lock:
+            loop = asyncio.get_running_loop()
+            wait = _next_send_time - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            _next_send_time = loop.time() + _SEND_MIN_INTERVAL
+        try:
+            return await coro
+        except TelegramRetryAfter as e:
+            # Telegram просит подождать - притормаживаем все отправки
+            async with _send_pace_lock:
+                _next_send_time = (asyncio.get_running_loop().time()
+                                   + e.retry_after)
+            raise
+
+
+def generate_project_code() -> str:
+    """Генерирует уникальный код проекта
+
+    По коду можно вступить в проект, поэтому берем криптостойкий
+    источник: 40 случайных бит одним сисколлом вместо цикла random.choices.
+    """
+    return base64.b32encode(secrets.token_bytes(5)).decode().rstrip('=')
+
+
+_TASK_TEMPLATE = ("Задача #{id}\n"
+                  "Описание: {description}\n"
+                  "Дедлайн: {deadline}\n"
+                  "Статус: {status}")
+
+
+def format_task_info(task) -> str:
+    """Форматирует информацию о задаче для вывода"""
+    # Дата хранится как ISO 'YYYY-MM-DD HH:MM:SS' - переставляем срезами,
+    # без парсинга datetime и strftime
+    deadline = task["deadline"]
+    return _TASK_TEMPLATE.format(
+        id=task["id"],
+        description=task["description"],
+        deadline=f"{deadline[8:10]}.{deadline[5:7]}.{deadline[0:4]} {deadline[11:16]}",
+        status=task["status"])
+
+
+# Лимиты Telegram на одно сообщение со встроенной клавиатурой
+_TASKS_TEXT_LIMIT = 3500
+_TASKS_PER_MESSAGE = 30
+
+
+def build_task_digests(tasks) -> list:
+    """Собирает список задач в минимум сообщений.
+
+    Вместо сообщения на каждую задачу - общий текст с блоками задач и
+    клавиатура со строкой кнопок на задачу; N вызовов API превращаются
+    в N/30. Возвращает список пар (текст, клавиатура).
+    """
+    digests = []
+    texts = []
+    rows = []
+    length = 0
+    for task in tasks:
+        block = format_task_info(task)
+        if texts and (length + len(block) > _TASKS_TEXT_LIMIT
+                      or len(rows) >= _TASKS_PER_MESSAGE):
+            digests.append(("\n\n".join(texts),
+                            InlineKeyboardMarkup(inline_keyboard=rows)))
+            texts, rows, length = [], [], 0
+        texts.append(block)
+        length += len(block) + 2
+        task_id = task["id"]
+        rows.append([
+            InlineKeyboardButton(text=f"✅ #{task_id}",
+                                 callback_data=f"complete_task_{task_id}"),
+            InlineKeyboardButton(text=f"📋 #{task_id}",
+                                 callback_data=f"task_details_{task_id}"),
+            InlineKeyboardButton(text=f"⭐ #{task_id}",
+                                 callback_data=f"leave_feedback_{task_id}"),
+        ])
+    if texts:
+        digests.append(("\n\n".join(texts),
+                        InlineKeyboardMarkup(inline_keyboard=rows)))
+    return digests
+
+
+_QWEN_CLIENT: Optional[Client] = None
+
+# Небольшой пул для блокирующих вызовов LLM, чтобы инференс не занимал event loop
+LLM_POOL = concurrent.futures.ThreadPoolExecutor(max_workers=4,
+                                                 thread_name_prefix="qwen")
+
+# Максимальное время ожидания ответа модели, секунды
+LLM_TIMEOUT = 30
+
+
+def get_qwen_client() -> Client:
+    """Ленивый singleton клиента Qwen - handshake со Space выполняется один раз"""
+    global _QWEN_CLIENT
+    if _QWEN_CLIENT is None:
+        _QWEN_CLIENT = Client(os.getenv("QWEN_URL", "Qwen/Qwen2.5"))
+    return _QWEN_CLIENT
+
+
+@functools.lru_cache(maxsize=512)
+def _predict_role(description: str, roles_key: tuple) -> str:
+    """Блокирующий вызов Qwen; одинаковые (описание, роли) берутся из кеша"""
+    # Используем общий клиент Qwen вместо нового handshake на каждый вызов
+    client = get_qwen_client()
+
+    # Формируем prompt для модели
+    prompt = f"""Проанализируйте это описание задачи и определите, какая роль лучше всего подходит для ее выполнения.
+Описание задачи: {description}
+Роли: {', '.join(roles_key)}
+
+Учесть следующее:
+1. Технические требования
+2. Необходимые навыки
+3. Тип выполняемой работы
+
+Укажите в ответ только одно название роли из списка доступных ролей, которое наилучшим образом соответствует данной задаче."""
+
+    result = client.predict(
+        query=prompt,
+        history=[],
+        system="Вы являетесь ассистентом по управлению проектами. Ваша задача - проанализировать задачи проекта и определить наиболее подходящую роль для выполнения.",
+        radio="72B",
+        api_name="/model_chat"
+    )
+
+    # Получаем рекомендованную роль из ответа
+    return result[1][0][1]['text'].strip()
+
+
+async def get_best_assignee(description: str, project_roles: list, db: Database, project_id: int) -> int:
+    try:
+        # Получаем ответ от модели в выделенном пуле потоков, не блокируя event loop
+        recommended_role = await asyncio.wait_for(
+            asyncio.get_running_loop().run_in_executor(
+                LLM_POOL,
+                _predict_role, description, tuple(sorted(project_roles))
+            ),
+            timeout=LLM_TIMEOUT
+        )
+
+        # Находим случайного пользователя с этой ролью в проекте.
+        # LIMIT/OFFSET по индексу вместо ORDER BY RANDOM(), который
+        # материализует все совпадения
+        cursor = await db.read_connection.execute(
+            '''
+            SELECT id FROM users
+            WHERE project_id = ? AND role = ?
+            LIMIT 1 OFFSET abs(random()) % max(
+                (SELECT COUNT(*) FROM users WHERE project_id = ? AND role = ?), 1)
+            ''', (project_id, recommended_role, project_id, recommended_role)
+        )
+        user = await cursor.fetchone()
+
+        if user:
+            return user["id"]
+        else:
+            # Если не нашли пользователя с рекомендованной ролью,
+            # выбираем случайного пользователя из проекта тем же способом:
+            # случайный OFFSET по индексу вместо сортировки всех строк
+            cursor = await db.read_connection.execute(
+                '''
+                SELECT id FROM users
+                WHERE project_id = ?
+                LIMIT 1 OFFSET abs(random()) % max(
+                    (SELECT COUNT(*) FROM users WHERE project_id = ?), 1)
+                ''', (project_id, project_id)
+            )
+            user = await cursor.fetchone()
+            return user["id"] if user else None
+
+    except Exception as e:
+        logging.error(f"Error in get_best_assignee: {e}")
+        return None
+
+
+
+# Обработчики
+router = Router()
+
+
+@router.message(Command("start"))
+async def cmd_start(message: Message, state: FSMContext, db: Database,
+                    user: tuple = None, project_manager_id: int = None):
+    if user:
+        is_manager = project_manager_id == message.from_user.id
+        await message.answer("С возвращением! Выберите действие:",
+                             reply_markup=get_main_keyboard(is_manager))
+        return
+
+    await state.set_state(RegistrationStates.waiting_for_name)
+    await message.answer("Добро пожаловать! Пожалуйста, введите ваше имя:")
+
+
+@router.message(F.text == "На главную")
+async def handle_home_button(message: Message, state: FSMContext, db: Database,
+                             user: tuple = None, project_manager_id: int = None):
+    if user:
+        is_manager = project_manager_id == message.from_user.id
+        await message.answer("С возвращением! Выберите действие:",
+                             reply_markup=get_main_keyboard(is_manager))
+        return
+
+    await state.set_state(RegistrationStates.waiting_for_name)
+    await message.answer("Добро пожаловать! Пожалуйста, введите ваше имя:")
+
+
+@router.callback_query(F.data.startswith("task_details_"))
+async def cb_task_details(callback: CallbackQuery, db: Database):
+    task_id = int(callback.data.split("_")[-1])
+    task = await db.get_task_by_id(task_id)  # Добавьте этот метод в класс Database
+    if not task:
+        await callback.answer("Задача не найдена", show_alert=True)
+        return
+
+    project = await db.get_project_by_id(task["project_id"])
+    assignee = await db.get_user_by_id(task["assigned_to"])
+
+    details = (
+        f"🔍 Подробная информация о задаче #{task['id']}\n\n"
+        f"📝 Описание: {task['description']}\n"
+        f"⏰ Дедлайн: {datetime.fromisoformat(task['deadline']).strftime('%d.%m.%Y %H:%M')}\n"
+        f"📋 Проект: {project['name']}\n"
+        f"👤 Исполнитель: {assignee['name']} ({assignee['role']})\n"
+        f"📊 Статус: {task['status']}\n"
+        f"📅 Создано: {datetime.fromisoformat(task['created_at']).strftime('%d.%m.%Y %H:%M')}"
+    )
+
+    await callback.message.edit_text(
+        details, reply_markup=get_task_inline_keyboard(task_id))
+    await callback.answer()
+
+
+@router.message(RegistrationStates.waiting_for_name)
+async def process_name(message: Message, state: FSMContext):
+    await state.update_data(name=message.text)
+    await state.set_state(RegistrationStates.waiting_for_project_code)
+    await message.answer(
+        "Введите код проекта или /create для создания нового проекта:")
+
+
+@router.message(Command("create"))
+@router.callback_query(F.data == "create_new_project")
+async def cmd_create_project(event: Union[Message, CallbackQuery], state: FSMContext):
+    await state.set_state(ProjectCreationStates.waiting_for_name)
+    if isinstance(event, CallbackQuery):
+        await event.message.edit_text("Введите название нового проекта:")
+    else:
+        await event.answer("Введите название нового проекта:")
+
+
+@router.message(ProjectCreationStates.waiting_for_name)
+async def process_project_name(message: Message, state: FSMContext, db: Database):
+    project_name = message.text
+    project_code = generate_project_code()
+
+    # Сохраняем данные проекта в state
+    await state.update_data(
+        project_name=project_name,
+        project_code=project_code
+    )
+
+    await state.set_state(ProjectCreationStates.waiting_for_roles)
+    await message.answer(
+        "Введите роли для вашего проекта через запятую.\n"
+        "Например: Программист, Дизайнер, Аналитик, Тестировщик"
+    )
+
+@router.message(ProjectCreationStates.waiting_for_roles)
+async def process_project_roles(message: Message, state: FSMContext, db: Database):
+    # Получаем роли из сообщения
+    roles = [role.strip() for role in message.text.split(',')]
+
+    # Получаем сохраненные данные проекта
+    data = await state.get_data()
+    project_name = data['project_name']
+    project_code = data['project_code']
+
+    # Создаем проект
+    project_id = await db.add_project(project_name, project_code, message.from_user.id)
+
+    # Добавляем роли проекта одной пачкой
+    await db.add_project_roles(project_id, roles)
+
+    try:
+        # Добавляем пользователя как менеджера проекта
+        await db.add_user(message.from_user.id, message.from_user.full_name, project_id, "Manager")
+    except sqlite3.IntegrityError:
+        # Игнорируем ошибку уникального ключа, так как пользователь уже существует
+        pass
+
+    await state.clear()
+
+    # Один round-trip к Telegram вместо двух: подсказка про кнопку
+    # "На главную" уезжает в то же сообщение, что и код проекта
+    await message.answer(
+        f"Проект '{project_name}' успешно создан!\n"
+        f"Ваша роль: Manager\n"
+        f"Доступные роли в проекте: {', '.join(roles)}\n\n"
+        f"Код проекта: `{project_code}`\n\n"
+        "Поделитесь этим кодом с участниками команды.\n"
+        "Для быстрого возврата в главное меню используйте кнопку 'На главную'.",
+        reply_markup=get_home_button(),
+        parse_mode="Markdown"
+    )
+
+
+
+
+@router.message(RegistrationStates.waiting_for_project_code)
+async def process_project_code(message: Message, state: FSMContext, db: Database):
+    if message.text == "/create":
+        await state.set_state(ProjectCreationStates.waiting_for_name)
+        await message.answer("Введите название нового проекта:")
+        return
+
+    project = await db.get_project(message.text)
+    if not project:
+        await message.answer(
+            "Проект не найден. Попробуйте еще раз или используйте /create для создания нового проекта."
+        )
+        return
+
+    # Получаем роли проекта
+    project_roles = await db.get_project_roles(project["id"])
+
+    if not project_roles:
+        await message.answer(
+            "В проекте не определены роли. Обратитесь к менеджеру проекта."
+        )
+        return
+
+    # Сохраняем данные проекта
+    await state.update_data(project_id=project["id"])
+
+    # Создаем клавиатуру с ролями
+    buttons = [[InlineKeyboardButton(text=role, callback_data=f"set_role_{role}")]
+               for role in project_roles]
+
+    await state.set_state(RegistrationStates.waiting_for_role)
+    await message.answer(
+        "Выберите вашу роль в проекте:",
+        reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons)
+    )
+
+@router.callback_query(F.data.startswith("set_role_"))
+async def process_role_selection(callback: CallbackQuery, state: FSMContext, db: Database):
+    selected_role = callback.data.split("set_role_")[1]
+    user_data = await state.get_data()
+
+    # Проверяем, не зарегистрирован ли уже пользователь
+    existing_user = await db.get_user(callback.from_user.id)
+    if existing_user:
+        await callback.message.edit_text(
+            "Вы уже зарегистрированы в проекте.",
+            reply_markup=get_main_keyboard(existing_user["role"] == "Manager")
+        )
+        return
+
+    # Добавляем пользователя
+    await db.add_user(
+        callback.from_user.id,
+        callback.from_user.full_name,  # Используем полное имя из Telegram
+        user_data["project_id"],
+        selected_role
+    )
+
+    await state.clear()
+    await callback.message.edit_text(
+        f"Регистрация успешно завершена!\n"
+        f"Ваша роль: {selected_role}"
+    )
+
+    await callback.message.answer(
+        "Выберите действие:",
+        reply_markup=get_main_keyboard(False)
+    )
+
+
+
+@router.message(RegistrationStates.waiting_for_role)
+async def process_role(message: Message, state: FSMContext, db: Database):
+    valid_roles = ["Программист", "Дизайнер", "Аналитик"]
+    if message.text not in valid_roles:
+        await message.answer(
+            "Пожалуйста, выберите одну из доступных ролей, используя кнопки ниже:",
+            reply_markup=get_role_keyboard())
+        return
+
+    user_data = await state.get_data()
+    await db.add_user(message.from_user.id, user_data["name"],
+                      user_data["project_id"], message.text)
+
+    await state.clear()
+    await message.answer(
+        "Регистрация завершена! Теперь вы можете получать и управлять задачами.",
+        reply_markup=get_main_keyboard(False))
+
+
+@router.callback_query(F.data == "create_task")
+async def cb_create_task(callback: CallbackQuery, state: FSMContext,
+                         db: Database, user: tuple):
+    project = await db.get_project_by_id(user["project_id"])
+    if project["manager_id"] != callback.from_user.id:
+        await callback.answer(
+            "Только руководитель проекта может создавать задачи.",
+            show_alert=True)
+        return
+
+    await callback.message.delete()  # Удаляем предыдущее сообщение
+    await state.set_state(TaskCreationStates.waiting_for_description)
+    await callback.message.answer("Опишите задачу:")
+    await callback.answer()
+
+
+@router.message(TaskCreationStates.waiting_for_description)
+async def process_task_description(message: Message, state: FSMContext):
+    # Сохраняем описание задачи
+    await state.update_data(description=message.text)
+
+    # Отправляем подтверждение и запрос дедлайна
+    await message.answer(f"✅ Описание задачи получено:\n{message.text}\n\n"
+                         "Теперь укажите дедлайн в формате ДД.ММ.ГГГГ ЧЧ:ММ\n"
+                         "Например: 31.12.2024 15:00")
+
+    # Переходим к следующему состоянию
+    await state.set_state(TaskCreationStates.waiting_for_deadline)
+
+
+@router.callback_query(F.data.startswith("assign_task_"))
+async def cb_assign_task(callback: CallbackQuery, state: FSMContext,
+                         db: Database):
+    assignee_id = int(callback.data.split("_")[-1])
+    task_data = await state.get_data()
+
+    task_id = await db.add_task(task_data.get("project_id"),
+                                task_data["description"], task_data["deadline"],
+                                assignee_id)
+
+    assignee = await db.get_user_by_id(
+        assignee_id)  # Добавьте этот метод в класс Database
+
+    await state.clear()
+    await callback.message.edit_text(
+        f"Задача создана и назначена на {assignee['name']}!",
+        reply_markup=get_main_keyboard(True))
+    await callback.answer()
+
+
+@router.message(TaskCreationStates.waiting_for_deadline)
+async def process_task_deadline(message: Message, state: FSMContext, db: Database, user: tuple, bot: Bot):
+    try:
+        deadline = datetime.strptime(message.text, '%d.%m.%Y %H:%M')
+    except ValueError:
+        await message.answer(
+            "Неверный формат даты. Попробуйте еще раз в формате ДД.ММ.ГГГГ ЧЧ:ММ"
+        )
+        return
+
+    task_data = await state.get_data()
+    project_id = user["project_id"]
+
+    # Получаем доступные роли проекта
+    project_roles = await db.get_project_roles(project_id)
+
+    # Получаем рекомендованного исполнителя
+    best_assignee = await get_best_assignee(
+        task_data["description"],
+        project_roles,
+        db,
+        project_id
+    )
+
+    if best_assignee:
+        # Создаем задачу с автоматически выбранным исполнителем
+        task_id = await db.add_task(
+            project_id,
+            task_data["description"],
+            deadline,
+            best_assignee
+        )
+
+        # Получаем информацию о выбранном исполнителе
+        assignee = await db.get_user_by_id(best_assignee)
+
+        await bot.send_message(
+            assignee["telegram_id"],
+            f"📢 Вам назначена новая задача!\n\n"
+            f"Описание: {task_data['description']}\n"
+            f"Дедлайн: {deadline.strftime('%d.%m.%Y %H:%M')}\n\n"
+            f"Используйте меню 'Мои задачи' для просмотра деталей.",
+            reply_markup=get_task_inline_keyboard(task_id)
+        )
+
+
+        await state.clear()
+        await message.answer(
+            f"✅ Задача автоматически назначена на {assignee['name']} ({assignee['role']})!\n"
+            f"Описание: {task_data['description']}\n"
+            f"Дедлайн: {deadline.strftime('%d.%m.%Y %H:%M')}",
+            reply_markup=get_main_keyboard(True)
+        )
+    else:
+        # Если не удалось автоматически назначить, показываем список исполнителей
+        project_users = await db.get_project_users(project_id)
+        user_buttons = []
+
+        for proj_user in project_users:
+            user_buttons.append([
+                InlineKeyboardButton(
+                    text=f"{proj_user['name']} ({proj_user['role']})",
+                    callback_data=f"assign_task_{proj_user['id']}"
+                )
+            ])
+
+        await message.answer(
+            "Не удалось автоматически назначить исполнителя. Выберите исполнителя вручную:",
+            reply_markup=InlineKeyboardMarkup(inline_keyboard=user_buttons)
+        )
+
+        await state.set_state(TaskCreationStates.waiting_for_assignee)
+
+
+@router.message(TaskCreationStates.waiting_for_assignee)
+async def process_task_assignee(message: Message, state: FSMContext,
+                                db: Database, user: tuple):
+    task_data = await state.get_data()
+
+    # Получаем ID пользователя из текста кнопки одним запросом по индексу,
+    # не перебирая весь список участников
+    assignee_name = message.text.split(" (")[0]
+    assignee = await db.get_user_by_project_and_name(user["project_id"], assignee_name)
+
+    task_id = await db.add_task(user["project_id"], task_data["description"],
+                                task_data["deadline"], assignee["id"])
+    await state.clear()
+    await message.answer(f"Задача создана и назначена на {assignee_name}!",
+                         reply_markup=get_main_keyboard(True))
+
+
+@router.message(F.text == "Мои задачи")
+async def show_tasks(message: Message, db: Database, user: tuple):
+    tasks = await db.get_tasks_by_user(user["id"])
+    if not tasks:
+        await message.answer("У вас пока нет активных задач.")
+        return
+
+    # Все задачи в одном сообщении (или нескольких при переполнении лимита)
+    # вместо вызова API на каждую задачу
+    await asyncio.gather(*[
+        send_limited(message.answer(text, reply_markup=keyboard))
+        for text, keyboard in build_task_digests(tasks)
+    ])
+
+
+@router.callback_query(F.data == "show_tasks")
+async def cb_show_tasks(callback: CallbackQuery, db: Database, user: tuple):
+    await callback.message.delete()  # Удаляем предыдущее сообщение
+
+    # Один JOIN вместо двух выборок по users: id и роль приходят вместе
+    active = await db.get_user_active_project(user["telegram_id"])
+    tasks = await db.get_tasks_by_user(active["user_id"])
+    if not tasks:
+        await callback.message.answer(
+            "У вас пока нет активных задач.",
+            reply_markup=get_main_keyboard(active["role"] == "Manager"))
+        return
+
+    # Все задачи в одном сообщении (или нескольких при переполнении лимита)
+    # вместо вызова API на каждую задачу
+    await asyncio.gather(*[
+        send_limited(callback.message.answer(text, reply_markup=keyboard))
+        for text, keyboard in build_task_digests(tasks)
+    ])
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith("complete_task_"))
+async def complete_task(callback: CallbackQuery, db: Database, user: tuple,
+                        project_manager_id: int = None):
+    try:
+        task_id = int(callback.data.split("_")[-1])
+        await db.update_task_status(task_id, "completed")
+
+        # Проверяем, является ли пользователь менеджером
+        is_manager = project_manager_id == callback.from_user.id
+
+        # Один edit вместо пары edit + answer: отметка о выполнении
+        # и главное меню в том же сообщении
+        await callback.message.edit_text(
+            f"{callback.message.text}\n✅ Задача выполнена!\nВыберите действие:",
+            reply_markup=get_main_keyboard(is_manager))
+
+        await callback.answer("Задача отмечена как выполненная!")
+
+    except Exception as e:
+        logging.error(f"Error in complete task: {e}")
+        await callback.answer("Произошла ошибка при выполнении задачи.",
+                              show_alert=True)
+
+
+# Готовый текстовый блок по каждому участнику собирает сам SQLite -
+# Python только склеивает блоки в одно сообщение. Константная строка
+# гарантирует попадание в кеш подготовленных стейтментов
+_SQL_PROJECT_REPORT = '''
+    WITH per AS (
+        SELECT assigned_to, status, COUNT(*) AS cnt
+        FROM tasks
+        WHERE project_id = ?
+        GROUP BY assigned_to, status
+    )
+    SELECT printf('%s (%s):', u.name, u.role) || X'0A' ||
+           GROUP_CONCAT('- ' || per.status || ': ' || per.cnt || ' задач', X'0A')
+    FROM per
+    JOIN users u ON u.id = per.assigned_to
+    GROUP BY u.id
+'''
+
+
+@router.callback_query(F.data == "project_report")
+async def cb_project_report(callback: CallbackQuery, db: Database,
+                            user: tuple):
+    try:
+        # Выборка проекта и проверка прав - один запрос
+        project = await db.get_active_project_if_manager(callback.from_user.id)
+        if not project:
+            await callback.answer(
+                "Отчет доступен только руководителю активного проекта.",
+                show_alert=True)
+            return
+
+        # Сразу гасим спиннер на кнопке - ACK не ждет агрегации отчета
+        await callback.answer()
+
+        # Статистику считаем по тому же проекту, по которому прошла
+        # проверка прав, а не по произвольной строке пользователя
+        cursor = await db.read_connection.execute(_SQL_PROJECT_REPORT,
+                                                  (project["id"], ))
+        stats = await cursor.fetchall()
+
+        if not stats:
+            report = f"📊 Отчет по проекту '{project['name']}'\n\nПока нет данных о задачах."
+        else:
+            report = (f"📊 Отчет по проекту '{project['name']}'\n\n"
+                      + "\n\n".join(row[0] for row in stats))
+
+        # Отчет не изменился с прошлого нажатия - редактировать нечего
+        if report == callback.message.text:
+            return
+
+        try:
+            await callback.message.edit_text(
+                report, reply_markup=get_main_keyboard(True))
+        except TelegramBadRequest:
+            # Если не удалось отредактировать сообщение, отправляем новое
+            await callback.message.answer(report,
+                                          reply_markup=get_main_keyboard(True))
+
+    except Exception as e:
+        logging.error(f"Error in project report: {e}")
+        await callback.answer("Произошла ошибка при формировании отчета.",
+                              show_alert=True)
+
+
+# Код проекта неизменен после выдачи - готовый текст сообщения кешируем по id
+_code_text_cache: Dict[int, str] = {}
+
+
+@router.callback_query(F.data == "get_project_code")
+async def cb_get_project_code(callback: CallbackQuery, db: Database, user: tuple):
+    # Выборка проекта и проверка прав - один запрос
+    active_project = await db.get_active_project_if_manager(callback.from_user.id)
+    if not active_project:
+        await callback.answer(
+            "Код проекта доступен только руководителю активного проекта.",
+            show_alert=True
+        )
+        return
+
+    # Сразу гасим спиннер на кнопке, не дожидаясь edit_text
+    await callback.answer()
+
+    text = _code_text_cache.get(active_project["id"])
+    if text is None:
+        text = (f"Код вашего проекта:\n\n`{active_project['code']}`\n\n"
+                "Поделитесь этим кодом с участниками команды.")
+        Database._cache_put(_code_text_cache, active_project["id"], text)
+
+    await callback.message.edit_text(
+        text,
+        reply_markup=get_project_code_keyboard(active_project["code"]),
+        parse_mode="Markdown"
+    )
+
+
+@router.callback_query(F.data == "back_to_main")
+async def cb_back_to_main(callback: CallbackQuery, db: Database, user: tuple):
+    # Сразу гасим спиннер на кнопке, не дожидаясь edit_text
+    await callback.answer()
+    is_manager = user["role"] == "Manager"
+    await callback.message.edit_text(
+        "Выберите действие:", reply_markup=get_main_keyboard(is_manager))
+
+
+@router.callback_query(F.data.startswith("role_"))
+async def cb_process_role(callback: CallbackQuery, state: FSMContext):
+    # Сообщаем пользователю, что нужно ввести роль текстом
+    await callback.message.answer(
+        "Пожалуйста, введите вашу роль текстом (Например: Программист, Дизайнер, Аналитик...):"
+    )
+    await callback.answer()
+
+# Add these handlers to the router section
+@router.callback_query(F.data == "switch_project")
+async def cb_switch_project(callback: CallbackQuery, db: Database):
+    # Получаем список проектов пользователя
+    projects = await db.get_user_projects(callback.from_user.id)
+
+    if not projects:
+        await callback.message.edit_text(
+            "У вас пока нет других проектов. Вы можете присоединиться к существующему проекту или создать новый.",
+            reply_markup=get_main_keyboard(False)
+        )
+        return
+
+    # Готовая клавиатура из кеша по списку (id, имя) проектов
+    await callback.message.edit_text(
+        "Выберите проект:",
+        reply_markup=get_project_picker_keyboard(
+            tuple((p["id"], p["name"]) for p in projects))
+    )
+
+@router.callback_query(F.data.startswith("select_project_"))
+async def cb_select_project(callback: CallbackQuery, db: Database):
+    project_id = int(callback.data.split("_")[-1])
+    await db.switch_user_project(callback.from_user.id, project_id)
+    project = await db.get_project_by_id(project_id)
+    is_manager = project["manager_id"] == callback.from_user.id
+
+    await callback.message.edit_text(
+        f"Проект изменен на: {project['name']}",
+        reply_markup=get_main_keyboard(is_manager)
+    )
+
+@router.callback_query(F.data == "join_project")
+async def cb_join_project(callback: CallbackQuery, state: FSMContext):
+    await state.set_state(ProjectManagementStates.waiting_for_new_project_code)
+    await callback.message.edit_text(
+        "Введите код проекта, к которому хотите присоединиться:\n\n"
+        "Для отмены нажмите кнопку 'На главную'"
+    )
+
+
+@router.message(ProjectManagementStates.waiting_for_new_project_code)
+async def process_new_project_code(message: Message, state: FSMContext, db: Database):
+    project = await db.get_project(message.text)
+    if not project:
+        await message.answer(
+            "Проект не найден. Попробуйте еще раз или нажмите 'На главную' для возврата в меню."
+        )
+        return
+
+    # Проверяем, не состоит ли пользователь уже в этом проекте
+    user_projects = await db.get_user_projects(message.from_user.id)
+    if any(p["id"] == project["id"] for p in user_projects):
+        await message.answer(
+            "Вы уже состоите в этом проекте. Используйте функцию 'Сменить проект' для переключения между проектами.",
+            reply_markup=get_main_keyboard(False)
+        )
+        await state.clear()
+        return
+
+    # Получаем роли проекта
+    project_roles = await db.get_project_roles(project["id"])
+
+    if not project_roles:
+        await message.answer(
+            "В проекте не определены роли. Обратитесь к менеджеру проекта."
+        )
+        await state.clear()
+        return
+
+    # Готовая клавиатура из кеша по (проект, набор ролей)
+    await message.answer(
+        f"Выберите вашу роль в проекте '{project['name']}':",
+        reply_markup=get_join_role_keyboard(project["id"], tuple(project_roles))
+    )
+
+
+@router.callback_query(F.data.startswith("join_role_"))
+async def process_join_role(callback: CallbackQuery, state: FSMContext, db: Database):
+    # Получаем project_id и role из callback_data
+    _, _, project_id, role = callback.data.split("_")
+    project_id = int(project_id)
+
+    try:
+        # Добавляем пользователя в новый проект
+        user_id = await db.add_user(
+            callback.from_user.id,
+            callback.from_user.full_name,
+            project_id,
+            role
+        )
+
+        # Переключаем пользователя на новый проект
+        await db.switch_user_project(callback.from_user.id, project_id)
+
+        # Получаем информацию о проекте
+        project = await db.get_project_by_id(project_id)
+        is_manager = project["manager_id"] == callback.from_user.id
+
+        await state.clear()
+
+        # Один edit вместо пары edit + answer: подтверждение
+        # и главное меню в том же сообщении
+        await callback.message.edit_text(
+            f"✅ Вы успешно присоединились к проекту '{project['name']}'\n"
+            f"Ваша роль: {role}\n\nВыберите действие:",
+            reply_markup=get_main_keyboard(is_manager)
+        )
+
+    except Exception as e:
+        logging.error(f"Error in process_join_role: {e}")
+        await callback.message.edit_text(
+            "Произошла ошибка при присоединении к проекту. Попробуйте еще раз.",
+            reply_markup=get_main_keyboard(False)
+        )
+        await state.clear()
+
+
+
+
+@router.callback_query(F.data == "delete_project")
+async def cb_delete_project(callback: CallbackQuery, state: FSMContext, db: Database,
+                            user: tuple = None, project_manager_id: int = None):
+    # Права проверяем по manager_id из middleware - без запроса к users
+    if project_manager_id != callback.from_user.id:
+        await callback.answer("Только владелец проекта может удалить его", show_alert=True)
+        return
+
+    project = await db.get_project_by_id(user["project_id"])
+    await state.set_state(ProjectManagementStates.confirm_project_deletion)
+    await callback.message.edit_text(
+        f"Вы уверены, что хотите удалить проект '{project['name']}'?\n"
+        "⚠️ Это действие нельзя отменить!\n\n"
+        "Для подтверждения напишите название проекта:"
+    )
+
+@router.message(ProjectManagementStates.confirm_project_deletion)
+async def confirm_project_deletion(message: Message, state: FSMContext, db: Database,
+                                   user: tuple = None):
+    project = await db.get_project_by_id(user["project_id"])
+    if message.text != project["name"]:
+        await message.answer("Название проекта введено неверно. Операция отменена.")
+        await state.clear()
+        return
+
+    if await db.delete_project(project["id"]):
+        await message.answer("Проект успешно удален.")
+    else:
+        await message.answer("Произошла ошибка при удалении проекта.")
+
+    await state.clear()
+
+
+@router.callback_query(F.data == "create_new_project")
+async def cb_create_new_project(callback: CallbackQuery, state: FSMContext):
+    await state.set_state(ProjectCreationStates.waiting_for_name)
+    await callback.message.edit_text("Введите название нового проекта:")
+
+
+
+@router.callback_query(F.data == "view_participants")
+async def cb_view_participants(callback: CallbackQuery, db: Database):
+    # Get active project with role
+    active_project = await db.get_user_active_project(callback.from_user.id)
+    if not active_project:
+        await callback.answer(
+            "Не удалось получить информацию о текущем проекте.",
+            show_alert=True
+        )
+        return
+
+    # Check if user is manager of this project
+    if active_project["manager_id"] != callback.from_user.id:
+        await callback.answer(
+            "Только руководитель проекта может просматривать список участников.",
+            show_alert=True
+        )
+        return
+
+    # Get project participants
+    participants = await db.get_project_participants(active_project["id"])
+
+    if not participants:
+        message_text = f"В проекте '{active_project['name']}' пока нет участников."
+    else:
+        # Собираем куски в список и склеиваем одним join -
+        # без квадратичных += по растущей строке
+        parts = [f"👥 Участники проекта '{active_project['name']}':\n\n"]
+        append = parts.append
+        current_role = None
+
+        for name, role, _ in participants:
+            if role != current_role:
+                append(f"\n{role}:\n")
+                current_role = role
+            append(f"- {name}\n")
+
+        message_text = "".join(parts)
+
+    # Add back button
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🔙 Вернуться", callback_data="back_to_main")]
+    ])
+
+    await callback.message.edit_text(
+        message_text,
+        reply_markup=keyboard
+    )
+
+
+
+
+
+
+
+class FeedbackStates(StatesGroup):
+    waiting_for_bot_feedback = State()
+
+
+@router.callback_query(F.data == "bot_feedback")
+async def cb_bot_feedback(callback: CallbackQuery, state: FSMContext):
+    await state.set_state(FeedbackStates.waiting_for_bot_feedback)
+    await callback.message.edit_text(
+        "Пожалуйста, поделитесь вашим мнением о работе бота.\n"
+        "Что можно улучшить? Какие функции добавить?\n"
+        "Ваш отзыв поможет сделать бота лучше!"
+    )
+
+@router.message(FeedbackStates.waiting_for_bot_feedback)
+async def process_bot_feedback(message: Message, state: FSMContext, db: Database,
+                               project_manager_id: int = None):
+    await db.add_bot_feedback(message.from_user.id, message.text)
+    await state.clear()
+    # manager_id уже пришел из middleware - без двух лишних запросов
+    await message.answer(
+        "Спасибо за ваш отзыв! Мы учтем его для улучшения работы бота.",
+        reply_markup=get_main_keyboard(project_manager_id == message.from_user.id)
+    )
+
+# Подсказки для незнакомых сообщений по текущему состоянию: (текст, клавиатура)
+_STATE_REPLIES = {
+    RegistrationStates.waiting_for_name.state:
+    ("Пожалуйста, введите ваше имя.", None),
+    RegistrationStates.waiting_for_project_code.state:
+    ("Пожалуйста, введите код проекта или используйте /create для создания нового проекта.",
+     None),
+    RegistrationStates.waiting_for_role.state:
+    ("Пожалуйста, выберите роль, используя кнопки ниже:", get_role_keyboard()),
+}
+
+
+@router.message()
+async def handle_unknown(message: Message, state: FSMContext):
+    current_state = await state.get_state()
+    if current_state:
+        # Если пользователь в процессе регистрации, показываем соответствующее сообщение
+        reply = _STATE_REPLIES.get(current_state)
+        if reply:
+            text, keyboard = reply
+            await message.answer(text, reply_markup=keyboard)
+    else:
+        # Если пользователь не в процессе регистрации
+        await message.answer(
+            "Извините, я не понимаю эту команду. Используйте доступные кнопки меню или /start для начала работы."
+        )
+
+
+# Планировщик задач
+
+# Задачи с приближающимися дедлайнами; остаток часов считает сам SQLite
+_SQL_UPCOMING_DEADLINES = '''
+    SELECT
+        t.id,
+        t.description,
+        u.telegram_id,
+        p.manager_id,
+        CAST((julianday(t.deadline) - julianday(?)) * 24 AS INTEGER) AS hours_left
+    FROM tasks t
+    JOIN users u ON t.assigned_to = u.id
+    JOIN projects p ON t.project_id = p.id
+    WHERE t.status != 'completed'
+    AND t.deadline <= ?
+    AND t.deadline > ?
+    ORDER BY t.deadline
+    LIMIT 1000
+'''
+
+
+class TaskScheduler:
+
+    def __init__(self, bot: Bot, db: Database):
+        # coalesce: пропущенные из-за простоя запуски схлопываются в один
+        self.scheduler = AsyncIOScheduler(
+            job_defaults={"coalesce": True, "misfire_grace_time": 3600})
+        self.bot = bot
+        self.db = db
+
+    async def _schedule_next_check(self, has_upcoming: bool):
+        """Назначает следующий запуск по ближайшему дедлайну.
+
+        Пока в 24-часовом окне нет ни одной задачи, нет смысла сканировать
+        базу каждый час - просыпаемся, когда ближайший дедлайн войдет в окно.
+        """
+        now = datetime.now()
+        if has_upcoming:
+            # В окне уже есть задачи - повторяем напоминания раз в час
+            next_run = now + timedelta(hours=1)
+        else:
+            cursor = await self.db.read_connection.execute(
+                '''
+                SELECT MIN(deadline) FROM tasks
+                WHERE status != 'completed' AND deadline > ?
+                ''', (now.strftime('%Y-%m-%d %H:%M:%S'), ))
+            row = await cursor.fetchone()
+            if row and row[0]:
+                next_run = max(
+                    datetime.fromisoformat(row[0]) - timedelta(hours=24),
+                    now + timedelta(minutes=1))
+            else:
+                # Открытых задач нет - дежурная проверка раз в час
+                next_run = now + timedelta(hours=1)
+
+        self.scheduler.add_job(self.check_deadlines, 'date', run_date=next_run,
+                               id='check_deadlines', replace_existing=True)
+
+    async def check_deadlines(self):
+        """Проверяет приближающиеся дедлайны и отправляет уведомления"""
+        has_upcoming = False
+        try:
+            now = datetime.now()
+            now_iso = now.strftime('%Y-%m-%d %H:%M:%S')
+            deadline_threshold = (now + timedelta(hours=24)).strftime('%Y-%m-%d %H:%M:%S')
+
+            cursor = await self.db.read_connection.execute(
+                _SQL_UPCOMING_DEADLINES, (now_iso, deadline_threshold, now_iso))
+
+            upcoming_tasks = await cursor.fetchall()
+            has_upcoming = bool(upcoming_tasks)
+
+            notifications = []
+            for task in upcoming_tasks:
+                task_id, description, user_id, manager_id, hours_left = task
+
+                # Уведомление исполнителю
+                notifications.append(send_limited(self.bot.send_message(
+                    user_id, f"⚠️ Напоминание!\n"
+                    f"До дедлайна задачи #{task_id} осталось {hours_left} часов!\n"
+                    f"Описание: {description}")))
+
+                # Если осталось менее 2 часов, уведомляем менеджера
+                if hours_left <= 2:
+                    notifications.append(send_limited(self.bot.send_message(
+                        manager_id, f"🚨 Внимание!\n"
+                        f"Задача #{task_id} может быть не выполнена вовремя!\n"
+                        f"До дедлайна осталось {hours_left} часов.\n"
+                        f"Описание: {description}")))
+
+            # send_limited сам выдерживает глобальный темп, поэтому пачку можно
+            # отдать gather целиком; return_exceptions - чтобы один
+            # заблокировавший бота пользователь не срывал остальные уведомления
+            results = await asyncio.gather(*notifications, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    logging.warning(f"Failed to send deadline notification: {result}")
+        finally:
+            # Job перепланирует себя сам, поэтому цепочка не должна рваться
+            # из-за одного неудачного прогона
+            try:
+                await self._schedule_next_check(has_upcoming)
+            except Exception as e:
+                logging.error(f"Error scheduling next deadline check: {e}")
+                self.scheduler.add_job(
+                    self.check_deadlines, 'date',
+                    run_date=datetime.now() + timedelta(hours=1),
+                    id='check_deadlines', replace_existing=True)
+
+    def start(self):
+        """Запускает планировщик"""
+        self.scheduler.start()
+        # Первый прогон сразу после старта; дальше job перепланирует себя сам
+        self.scheduler.add_job(self.check_deadlines, 'date',
+                               run_date=datetime.now() + timedelta(seconds=10),
+                               id='check_deadlines', replace_existing=True)
+
+
+async def main():
+    # Настройка логирования
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+    # Загрузка конфигурации
+    config = load_config()
+
+    # Инициализация базы данных
+    db = await Database.connect("project_bot.db")
+
+    # Одна aiohttp-сессия с пулом keep-alive соединений на все вызовы
+    # Telegram API - без TLS handshake на каждый запрос
+    session = AiohttpSession()
+    session._connector_init.update(
+        limit=100,
+        ttl_dns_cache=300,
+        keepalive_timeout=75,
+    )
+
+    # Инициализация бота и диспетчера; состояния FSM переживают рестарт
+    bot = Bot(token=config.token, session=session)
+    storage = await SqliteStorage.create("project_bot.db")
+    dp = Dispatcher(storage=storage)
+
+    # Создаем middleware с передачей базы данных
+    auth_middleware = AuthMiddleware(db)
+
+    # Регистрируем middleware на оба потока апдейтов
+    dp.message.middleware(auth_middleware)
+    dp.callback_query.middleware(auth_middleware)
+
+    # Регистрация роутера
+    dp.include_router(router)
+
+    # Инициализация и запуск планировщика задач
+    scheduler = TaskScheduler(bot, db)
+    scheduler.start()
+
+    try:
+        # Длинный long-poll: меньше пустых getUpdates и холостых пробуждений
+        await dp.start_polling(bot, polling_timeout=25)
+    finally:
+        # Не теряем накопленные, но еще не записанные отзывы
+        await db.flush_feedback()
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())